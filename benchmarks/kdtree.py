@@ -0,0 +1,65 @@
+"""Compares brute force top-k scoring with the exact KDTree engine.
+
+    $ python benchmarks/kdtree.py --sizes 10000 100000 1000000 --limit 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from motoapi.scoring import FeatureMatrix  # noqa: E402
+from recommendation import ATTRIBUTES  # noqa: E402
+
+
+def synthetic_matrix(size, seed=0):
+    rnd = np.random.RandomState(seed)
+    values = np.column_stack([
+        rnd.randint(low, high + 1, size).astype(float)
+        for _, low, high in ATTRIBUTES])
+    return FeatureMatrix(np.arange(1, size + 1),
+        [attr for attr, _, _ in ATTRIBUTES], values)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+        default=[10000, 100000, 1000000])
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+    rnd = np.random.RandomState(1)
+
+    print('%10s %12s %14s %14s' % (
+        'rows', 'build (s)', 'brute (ms/q)', 'kdtree (ms/q)'))
+    for size in args.sizes:
+        matrix = synthetic_matrix(size)
+        _, build_time = timed(matrix.get_index)
+        preferences = [
+            {attr: float(rnd.randint(low, high + 1))
+             for attr, low, high in ATTRIBUTES}
+            for _ in range(args.queries)]
+        brute_time = kdtree_time = 0
+        for preference in preferences:
+            brute, elapsed = timed(matrix.rank, preference, args.limit)
+            brute_time += elapsed
+            kdtree, elapsed = timed(matrix.rank, preference, args.limit,
+                use_index=True)
+            kdtree_time += elapsed
+            assert kdtree == brute
+        print('%10d %12.3f %14.2f %14.2f' % (
+            size, build_time, brute_time * 1000 / args.queries,
+            kdtree_time * 1000 / args.queries))
+
+
+if __name__ == '__main__':
+    main()
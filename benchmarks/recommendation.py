@@ -0,0 +1,101 @@
+"""Compares the per-bike Python scoring loop with the vectorized
+FeatureMatrix on a synthetic catalog.
+
+    $ python benchmarks/recommendation.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from motoapi.scoring import FeatureMatrix  # noqa: E402
+
+ATTRIBUTES = [
+    ('model_year', 1970, 2022),
+    ('displacement', 50, 2500),
+    ('top_speed', 40, 320),
+    ('power', 2, 220),
+    ('fuel_capacity', 3, 40),
+    ('weight', 70, 450),
+    ('valves_per_cylinder', 1, 5),
+    ('category', 0, 7),
+]
+
+
+def synthetic_bikes(size, seed=0):
+    rnd = random.Random(seed)
+    return {
+        bike_id: {
+            attr: float(rnd.randint(low, high))
+            for attr, low, high in ATTRIBUTES}
+        for bike_id in range(1, size + 1)
+    }
+
+
+def legacy_rank(bikes, preference):
+    """The scoring loop AttributeHandler.get_recommendations used to run"""
+    min_attributes = {}
+    max_attributes = {}
+    for bike in bikes.values():
+        for attr in preference:
+            value = bike[attr]
+            min_attributes[attr] = min(min_attributes.get(attr, value), value)
+            max_attributes[attr] = max(max_attributes.get(attr, value), value)
+    distance_d = []
+    min_distance = 99999999
+    max_distance = 0
+    for bike_id, bike in bikes.items():
+        distance = 0
+        for attr in preference:
+            mx = max_attributes[attr]
+            mn = min_attributes[attr]
+
+            def clap(value):
+                num = (value - mn)
+                div = (mx - mn)
+                if div != 0:
+                    num /= div
+                return num
+            distance += abs(clap(bike[attr]) - clap(preference[attr]))
+        min_distance = min(min_distance, distance)
+        max_distance = max(max_distance, distance)
+        distance_d.append((bike_id, distance))
+    div = (max_distance - min_distance) or 1
+    distance_d = [(bike_id, ((distance - min_distance) / div) * 100)
+                  for bike_id, distance in distance_d]
+    distance_d.sort(key=lambda x: x[1], reverse=True)
+    return distance_d
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+        default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+    preference = {attr: (low + high) / 2 for attr, low, high in ATTRIBUTES}
+
+    print('%10s %12s %12s %12s %9s' % (
+        'rows', 'legacy (s)', 'build (s)', 'rank (s)', 'speedup'))
+    for size in args.sizes:
+        bikes = synthetic_bikes(size)
+        legacy, legacy_time = timed(legacy_rank, bikes, preference)
+        matrix, build_time = timed(FeatureMatrix.from_bikes, bikes,
+            list(preference))
+        ranked, rank_time = timed(matrix.rank, preference)
+        assert ranked == legacy
+        print('%10d %12.3f %12.3f %12.3f %8.1fx' % (
+            size, legacy_time, build_time, rank_time,
+            legacy_time / rank_time))
+
+
+if __name__ == '__main__':
+    main()
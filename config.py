@@ -26,4 +26,68 @@ class Config(object):
     PASSWORD_HASH = os.environ.get('PASSWORD_HASH') or 'sha512_crypt'
     PASSWORD_SALT = os.environ.get('PASSWORD_SALT') or SECURITY_PASSWORD_SALT
 
-    JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=3)
\ No newline at end of file
+    JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=3)
+    # Rejects the tokens revoked through the token_blacklist table
+    JWT_BLACKLIST_ENABLED = True
+
+    # Seconds between catalog version probes of the recommendation cache
+    CATALOG_VERSION_INTERVAL = int(
+        os.environ.get('CATALOG_VERSION_INTERVAL') or 30)
+    # Recommendation engine, 'brute' scores every bike and 'kdtree' answers
+    # limited queries from an exact k-d tree over the catalog
+    RECOMMENDATION_ENGINE = os.environ.get('RECOMMENDATION_ENGINE') or 'brute'
+    # Seconds between reshuffles of the cold start recommendation pool
+    COLD_START_POOL_INTERVAL = int(
+        os.environ.get('COLD_START_POOL_INTERVAL') or 300)
+    # Recommendation result cache, QUANTUM rounds the preference values to
+    # multiples of it so near identical queries share an entry (0 disables)
+    RECOMMENDATION_CACHE_SIZE = int(
+        os.environ.get('RECOMMENDATION_CACHE_SIZE') or 1024)
+    RECOMMENDATION_CACHE_TTL = int(
+        os.environ.get('RECOMMENDATION_CACHE_TTL') or 60)
+    RECOMMENDATION_CACHE_QUANTUM = float(
+        os.environ.get('RECOMMENDATION_CACHE_QUANTUM') or 0)
+    # Connection pool of every worker, sqlite doesn't pool connections
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 10)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 20)
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)
+    DATABASE_POOL_RECYCLE = int(
+        os.environ.get('DATABASE_POOL_RECYCLE') or 1800)
+    # Cooperative psycopg2 for the gevent uWSGI deployment, the worker must
+    # be monkey patched before the app is loaded
+    DATABASE_GEVENT = bool(os.environ.get('DATABASE_GEVENT'))
+    # Connections shared by every greenlet of a cooperative worker
+    DATABASE_GEVENT_POOL_SIZE = int(
+        os.environ.get('DATABASE_GEVENT_POOL_SIZE') or 50)
+    # Page size of cursor paginated lists requested without page_size
+    CURSOR_PAGE_SIZE = int(os.environ.get('CURSOR_PAGE_SIZE') or 50)
+    # Optional read replica, the queries of read-only requests go to it
+    REPLICA_DATABASE_URI = os.environ.get('MOTOAPI_REPLICA_DATABASE_URL')
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URI} \
+        if REPLICA_DATABASE_URI else {}
+    # Seconds a user reads from the primary after writing, at least the
+    # replication lag
+    REPLICA_STICKY_SECONDS = int(
+        os.environ.get('REPLICA_STICKY_SECONDS') or 10)
+    # Revoked token cache in front of the blacklist lookups (0 disables), a
+    # known good token is rechecked after TTL seconds at most
+    REVOKED_TOKEN_CACHE_SIZE = int(
+        os.environ.get('REVOKED_TOKEN_CACHE_SIZE') or 10000)
+    REVOKED_TOKEN_CACHE_TTL = int(
+        os.environ.get('REVOKED_TOKEN_CACHE_TTL') or 300)
+    # Seconds between probes of the revocation generation, how long the
+    # other workers may accept a token revoked elsewhere
+    REVOKED_TOKEN_CACHE_INTERVAL = float(
+        os.environ.get('REVOKED_TOKEN_CACHE_INTERVAL') or 1)
+    # Seconds between expired token purges of a background thread in every
+    # worker, 0 leaves them to a scheduled manage.py purge_tokens
+    TOKEN_PURGE_INTERVAL = int(os.environ.get('TOKEN_PURGE_INTERVAL') or 0)
+    TOKEN_PURGE_BATCH_SIZE = int(
+        os.environ.get('TOKEN_PURGE_BATCH_SIZE') or 1000)
+    # pbkdf2_sha512 rounds of new password hashes, the ones of another cost
+    # are rehashed on the next login
+    PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS') or 25000)
+    # Threads the password hashes run on, at most this many at once. Logins
+    # wait for one instead of blocking the worker (0 hashes in the request)
+    PASSWORD_HASH_POOL_SIZE = int(
+        os.environ.get('PASSWORD_HASH_POOL_SIZE') or 2)
@@ -8,7 +8,9 @@ from flask_script import Manager
 import lorem
 
 from motoapi import db, motoapi
-from motoapi.models import Brand, Variation
+from motoapi.models import (Brand, Variation, UserPreference,
+    CacheGeneration, VariantStats, TokenBlacklist)
+from motoapi.importer import VersionImporter, import_brands
 
 manager = Manager(motoapi)
 
@@ -19,38 +21,37 @@ def init_db():
 
 
 @manager.command
-def import_data():
-    con = psycopg2.connect("dbname=motos user=motos password=motos")
+def import_data(source='dbname=motos user=motos password=motos',
+        after=0, chunk_size=5000):
+    """Imports the brands and versions of the source catalog database.
+    Versions are streamed with a server side cursor and inserted in chunks,
+    an interrupted import resumes with --after <last id> or just by running
+    it again, the names already imported are skipped.
+    """
+    con = psycopg2.connect(source)
     cur = con.cursor()
     cur.execute("""
                 select name from brands
                 """)
-    for brand in cur.fetchall():
-        if not Brand.query.filter_by(name=brand[0]).first():
-            db.session.add(Brand(name=brand[0]))
-    db.session.commit()
+    brands = import_brands(name for name, in cur.fetchall())
+    cur.close()
+
+    cur = con.cursor(name='import_data_versions')
+    cur.itersize = int(chunk_size)
     cur.execute("""
                 select v.*, b.name
                 from versions v
-                inner join brands b on (b.id = v.brand_id);""")
-
-    for moto in cur.fetchall():
-        brand = Brand.query.filter_by(name=moto[6]).first()
-        if not brand or Variation.query.filter_by(
-                name=moto[1].split(' (')[0]).count():
-            continue
-        try:
-            db.session.add(Variation(
-                name=moto[1].split(' (')[0].strip(),
-                brand=brand,
-                model_year=int(moto[1].split(' (')[1][0:4]),
-                year=moto[3],
-                fuel=moto[4],
-                price=moto[5],
-            ))
-        except Exception as e:
-            continue
-    db.session.commit()
+                inner join brands b on (b.id = v.brand_id)
+                where v.id > %s
+                order by v.id;""", (int(after),))
+
+    def report(stats):
+        print('%(read)s read, %(imported)s imported, %(skipped)s skipped, '
+              '%(rows_per_second).0f rows/s, last id %(last_id)s' % stats)
+
+    VersionImporter(brands, int(chunk_size), report).run(cur)
+    cur.close()
+    con.close()
 
 
 @manager.command
@@ -65,5 +66,61 @@ def update_data(validated=False):
             moto.update_data()
 
 
+@manager.command
+def update_features(batch_size=1000):
+    """Backfills the typed feature columns from the scraped extra_data"""
+    last_id = 0
+    while True:
+        motos = Variation.query.filter(
+            Variation.id > last_id,
+            Variation.fetch_state == 'success',
+        ).order_by(Variation.id).limit(batch_size).all()
+        if not motos:
+            break
+        for moto in motos:
+            moto.update_features()
+        db.session.commit()
+        last_id = motos[-1].id
+        print('Processed up to %s' % last_id)
+
+
+@manager.command
+def rebuild_preferences():
+    """Recomputes every user taste vector from the liked_variant table"""
+    rebuilt = UserPreference.rebuild(None)
+    db.session.commit()
+    print('Rebuilt %s preferences' % len(rebuilt))
+
+
+@manager.command
+def rebuild_swipe_stats():
+    """Recounts the variant and category swipe counters from the
+    liked_variant and disliked_variant tables.
+    """
+    rebuilt = VariantStats.rebuild()
+    db.session.commit()
+    print('Rebuilt the swipe counters of %s variants' % len(rebuilt))
+
+
+@manager.command
+def purge_tokens(batch_size=1000):
+    """Deletes the expired tokens of the token_blacklist table in batches"""
+    print('Before: %(rows)s tokens, %(expired)s expired, %(size)s bytes' %
+          TokenBlacklist.table_stats())
+    deleted = TokenBlacklist.purge_expired(int(batch_size))
+    print('Purged %s expired tokens' % deleted)
+    print('After: %(rows)s tokens, %(expired)s expired, %(size)s bytes' %
+          TokenBlacklist.table_stats())
+
+
+@manager.command
+def clear_recommendation_cache():
+    """Invalidates the catalog and recommendation result caches of every
+    worker on their next catalog version probe.
+    """
+    CacheGeneration.bump('recommendation')
+    db.session.commit()
+
+
 if __name__ == '__main__':
     manager.run()
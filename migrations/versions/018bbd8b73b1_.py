@@ -0,0 +1,36 @@
+"""add typed variation feature columns
+
+Revision ID: 018bbd8b73b1
+Revises: 1c167e4b413c
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '018bbd8b73b1'
+down_revision = '1c167e4b413c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('variation', sa.Column('displacement', sa.Float(), nullable=True))
+    op.add_column('variation', sa.Column('top_speed', sa.Float(), nullable=True))
+    op.add_column('variation', sa.Column('power', sa.Float(), nullable=True))
+    op.add_column('variation', sa.Column('fuel_capacity', sa.Float(), nullable=True))
+    op.add_column('variation', sa.Column('weight', sa.Float(), nullable=True))
+    op.add_column('variation', sa.Column('valves_per_cylinder', sa.Integer(), nullable=True))
+    op.add_column('variation', sa.Column('category', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('variation', 'category')
+    op.drop_column('variation', 'valves_per_cylinder')
+    op.drop_column('variation', 'weight')
+    op.drop_column('variation', 'fuel_capacity')
+    op.drop_column('variation', 'power')
+    op.drop_column('variation', 'top_speed')
+    op.drop_column('variation', 'displacement')
@@ -0,0 +1,37 @@
+"""add user_preference running sums
+
+Revision ID: 1ac209db07a5
+Revises: 018bbd8b73b1
+Create Date: 2026-10-18 11:04:52.671390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1ac209db07a5'
+down_revision = '018bbd8b73b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_preference',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('model_year', sa.Float(), nullable=False),
+    sa.Column('displacement', sa.Float(), nullable=False),
+    sa.Column('top_speed', sa.Float(), nullable=False),
+    sa.Column('power', sa.Float(), nullable=False),
+    sa.Column('fuel_capacity', sa.Float(), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.Column('valves_per_cylinder', sa.Float(), nullable=False),
+    sa.Column('category', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_preference')
@@ -0,0 +1,60 @@
+"""add indexes of the hot lookups
+
+Revision ID: 3d0e7a2f95c1
+Revises: f4c010afa9ba
+Create Date: 2026-10-18 13:02:41.208817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d0e7a2f95c1'
+down_revision = 'f4c010afa9ba'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Repeated swipes were stored twice, keep the first one
+    for table in ['liked_variant', 'disliked_variant']:
+        op.execute(
+            'DELETE FROM %s WHERE id NOT IN '
+            '(SELECT min(id) FROM %s GROUP BY user_id, variant_id)' % (
+                table, table))
+    op.create_index(op.f('ix_token_blacklist_jti'), 'token_blacklist',
+        ['jti'], unique=True)
+    op.create_index(op.f('ix_token_blacklist_user_identity'),
+        'token_blacklist', ['user_identity'], unique=False)
+    op.create_index('ix_liked_variant_user_id_variant_id', 'liked_variant',
+        ['user_id', 'variant_id'], unique=True)
+    op.create_index(op.f('ix_liked_variant_variant_id'), 'liked_variant',
+        ['variant_id'], unique=False)
+    op.create_index('ix_disliked_variant_user_id_variant_id',
+        'disliked_variant', ['user_id', 'variant_id'], unique=True)
+    op.create_index(op.f('ix_disliked_variant_variant_id'),
+        'disliked_variant', ['variant_id'], unique=False)
+    op.create_index(op.f('ix_variation_fetch_state'), 'variation',
+        ['fetch_state'], unique=False)
+    op.create_index(op.f('ix_variation_brand_id'), 'variation',
+        ['brand_id'], unique=False)
+    op.create_index(op.f('ix_brand_name'), 'brand', ['name'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_brand_name'), table_name='brand')
+    op.drop_index(op.f('ix_variation_brand_id'), table_name='variation')
+    op.drop_index(op.f('ix_variation_fetch_state'), table_name='variation')
+    op.drop_index(op.f('ix_disliked_variant_variant_id'),
+        table_name='disliked_variant')
+    op.drop_index('ix_disliked_variant_user_id_variant_id',
+        table_name='disliked_variant')
+    op.drop_index(op.f('ix_liked_variant_variant_id'),
+        table_name='liked_variant')
+    op.drop_index('ix_liked_variant_user_id_variant_id',
+        table_name='liked_variant')
+    op.drop_index(op.f('ix_token_blacklist_user_identity'),
+        table_name='token_blacklist')
+    op.drop_index(op.f('ix_token_blacklist_jti'),
+        table_name='token_blacklist')
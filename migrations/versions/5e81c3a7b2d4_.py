@@ -0,0 +1,48 @@
+"""add the spec filter indexes of variation
+
+Revision ID: 5e81c3a7b2d4
+Revises: 9b2f4c6d8e10
+Create Date: 2026-10-18 14:21:37.662025
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e81c3a7b2d4'
+down_revision = '9b2f4c6d8e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_variation_fetch_state_category_displacement',
+        'variation', ['fetch_state', 'category', 'displacement'],
+        unique=False)
+    op.create_index('ix_variation_fetch_state_displacement', 'variation',
+        ['fetch_state', 'displacement'], unique=False)
+    op.create_index('ix_variation_fetch_state_power', 'variation',
+        ['fetch_state', 'power'], unique=False)
+    op.create_index('ix_variation_fetch_state_price', 'variation',
+        ['fetch_state', 'price'], unique=False)
+    op.create_index('ix_variation_brand_id_displacement', 'variation',
+        ['brand_id', 'displacement'], unique=False)
+    # Both are prefixes of the new indexes
+    op.drop_index('ix_variation_fetch_state', table_name='variation')
+    op.drop_index('ix_variation_brand_id', table_name='variation')
+
+
+def downgrade():
+    op.create_index('ix_variation_brand_id', 'variation', ['brand_id'],
+        unique=False)
+    op.create_index('ix_variation_fetch_state', 'variation', ['fetch_state'],
+        unique=False)
+    op.drop_index('ix_variation_brand_id_displacement',
+        table_name='variation')
+    op.drop_index('ix_variation_fetch_state_price', table_name='variation')
+    op.drop_index('ix_variation_fetch_state_power', table_name='variation')
+    op.drop_index('ix_variation_fetch_state_displacement',
+        table_name='variation')
+    op.drop_index('ix_variation_fetch_state_category_displacement',
+        table_name='variation')
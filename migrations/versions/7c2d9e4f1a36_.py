@@ -0,0 +1,66 @@
+"""store token jti in 16 bytes and index token expires
+
+Revision ID: 7c2d9e4f1a36
+Revises: 5e81c3a7b2d4
+Create Date: 2026-10-18 16:05:12.418730
+
+"""
+import datetime
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d9e4f1a36'
+down_revision = '5e81c3a7b2d4'
+branch_labels = None
+depends_on = None
+
+token_blacklist = sa.table('token_blacklist',
+    sa.column('id', sa.Integer), sa.column('jti'), sa.column('expires'),
+    sa.column('jti_copy'))
+
+
+def convert_jti(type_, convert):
+    """Rewrites jti through a copy column, sqlite can't alter its type"""
+    bind = op.get_bind()
+    op.drop_index('ix_token_blacklist_jti', table_name='token_blacklist')
+    op.add_column('token_blacklist', sa.Column('jti_copy', type_))
+    for token_id, jti in bind.execute(sa.select(
+            [token_blacklist.c.id, token_blacklist.c.jti])).fetchall():
+        bind.execute(token_blacklist.update().where(
+            token_blacklist.c.id == token_id).values(jti_copy=convert(jti)))
+    with op.batch_alter_table('token_blacklist') as batch_op:
+        batch_op.drop_column('jti')
+        batch_op.alter_column('jti_copy', new_column_name='jti',
+            existing_type=type_, nullable=False)
+    op.create_index('ix_token_blacklist_jti', 'token_blacklist', ['jti'],
+        unique=True)
+
+
+def upgrade():
+    # Expired tokens fail the exp check anyway, don't convert them
+    op.execute(token_blacklist.delete().where(
+        token_blacklist.c.expires < datetime.datetime.now()))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('token_blacklist', 'jti', type_=postgresql.UUID(),
+            existing_type=sa.String(), existing_nullable=False,
+            postgresql_using='jti::uuid')
+    else:
+        convert_jti(sa.LargeBinary(16), lambda jti: uuid.UUID(jti).bytes)
+    op.create_index(op.f('ix_token_blacklist_expires'), 'token_blacklist',
+        ['expires'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_token_blacklist_expires'),
+        table_name='token_blacklist')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('token_blacklist', 'jti', type_=sa.String(),
+            existing_type=postgresql.UUID(), existing_nullable=False,
+            postgresql_using='jti::text')
+    else:
+        convert_jti(sa.String(), lambda jti: str(uuid.UUID(bytes=jti)))
@@ -0,0 +1,62 @@
+"""add variant_stats and category_stats swipe counters
+
+Revision ID: 9b2f4c6d8e10
+Revises: 3d0e7a2f95c1
+Create Date: 2026-10-18 13:48:15.904173
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2f4c6d8e10'
+down_revision = '3d0e7a2f95c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('variant_stats',
+    sa.Column('variant_id', sa.Integer(), nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.Column('dislikes', sa.Integer(), nullable=False),
+    sa.Column('last_swiped_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['variant_id'], ['variation.id'], ),
+    sa.PrimaryKeyConstraint('variant_id')
+    )
+    op.create_index(op.f('ix_variant_stats_dislikes'), 'variant_stats',
+        ['dislikes'], unique=False)
+    op.create_index(op.f('ix_variant_stats_likes'), 'variant_stats',
+        ['likes'], unique=False)
+    op.create_table('category_stats',
+    sa.Column('category', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.Column('dislikes', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('category')
+    )
+    # Count the swipes made before the counters existed
+    op.execute("""
+        INSERT INTO variant_stats (variant_id, likes, dislikes)
+        SELECT variant_id, sum(likes), sum(dislikes) FROM (
+            SELECT variant_id, 1 AS likes, 0 AS dislikes FROM liked_variant
+            UNION ALL
+            SELECT variant_id, 0, 1 FROM disliked_variant) AS swipes
+        WHERE variant_id IS NOT NULL
+        GROUP BY variant_id
+    """)
+    op.execute("""
+        INSERT INTO category_stats (category, likes, dislikes)
+        SELECT coalesce(variation.category, -1), sum(likes), sum(dislikes)
+        FROM variant_stats JOIN variation
+            ON variation.id = variant_stats.variant_id
+        GROUP BY coalesce(variation.category, -1)
+    """)
+
+
+def downgrade():
+    op.drop_table('category_stats')
+    op.drop_index(op.f('ix_variant_stats_likes'), table_name='variant_stats')
+    op.drop_index(op.f('ix_variant_stats_dislikes'),
+        table_name='variant_stats')
+    op.drop_table('variant_stats')
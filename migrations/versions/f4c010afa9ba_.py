@@ -0,0 +1,28 @@
+"""add cache_generation
+
+Revision ID: f4c010afa9ba
+Revises: 1ac209db07a5
+Create Date: 2026-10-18 12:20:07.518842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c010afa9ba'
+down_revision = '1ac209db07a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_generation',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_generation')
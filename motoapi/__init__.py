@@ -5,7 +5,6 @@ from sentry_sdk.integrations.flask import FlaskIntegration
 from sentry_sdk.integrations.logging import ignore_logger
 from werkzeug.exceptions import HTTPException, BadRequest, MethodNotAllowed
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_babelex import Babel
 from flask_babelex import format_datetime as babel_datetime
@@ -15,6 +14,7 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 
 from config import Config
+from motoapi.database import SQLAlchemy
 
 ignore_logger('engineio.server')
 
@@ -63,6 +63,8 @@ from motoapi.resources.user import (
 from motoapi.resources.variant import (
     DashBoard,
     Recommendation,
+    RecommendationBatch,
+    RecommendationStats,
     VariantResource,
     TinderSwinger,
     )
@@ -74,6 +76,8 @@ api.add_resource(MeResource, '/api/user/me')
 # Variant
 api.add_resource(VariantResource, '/api/variant')
 api.add_resource(Recommendation, '/api/variant/recommendation')
+api.add_resource(RecommendationBatch, '/api/variant/recommendation/batch')
+api.add_resource(RecommendationStats, '/api/variant/recommendation/stats')
 api.add_resource(TinderSwinger, '/api/variant/swinger')
 api.add_resource(DashBoard, '/api/variant/dash')
 
@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+
+import numpy as np
+from sqlalchemy.sql import func, select
+
+from motoapi import motoapi, db
+from motoapi.cache import LRUCache
+from motoapi.models import Variation, CacheGeneration
+from motoapi.scoring import FeatureMatrix
+
+
+def feature_query(*entities):
+    """Returns a query over the variations that have every feature"""
+    return db.session.query(*entities).filter(
+        Variation.fetch_state == 'success',
+        *[getattr(Variation, attr).isnot(None)
+          for attr in Variation.FEATURES])
+
+
+def load_features(ids=None):
+    """Loads the typed feature columns into a FeatureMatrix.
+    :param ids: Only load these variation ids
+    """
+    query = feature_query(Variation.id, *[
+        getattr(Variation, attr) for attr in Variation.FEATURES])
+    if ids is not None:
+        query = query.filter(Variation.id.in_(ids))
+    rows = query.order_by(Variation.id).all()
+    return FeatureMatrix(
+        [row[0] for row in rows],
+        Variation.FEATURES,
+        [row[1:] for row in rows])
+
+
+def catalog_version():
+    """Returns a cheap fingerprint of the catalog, it changes whenever
+    update_data or update_features write a variation or the recommendation
+    cache generation is bumped.
+    """
+    generation = db.session.query(CacheGeneration.generation).filter(
+        CacheGeneration.name == 'recommendation').as_scalar()
+    return tuple(feature_query(
+        func.count(Variation.id), func.max(Variation.updated_at),
+        generation).one())
+
+
+class CatalogCache:
+    """Process wide cache of the catalog FeatureMatrix. The catalog version
+    is probed at most once every CATALOG_VERSION_INTERVAL seconds and the
+    matrix is only rebuilt when it changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.matrix = None
+        self.version = None
+        self.checked_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.build_time = 0
+
+    def stats(self):
+        return {
+            'version': str(self.version),
+            'rows': len(self.matrix) if self.matrix is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'build_time': self.build_time,
+        }
+
+    def get(self):
+        interval = motoapi.config['CATALOG_VERSION_INTERVAL']
+        if (self.matrix is not None
+                and time.monotonic() - self.checked_at < interval):
+            self.hits += 1
+            return self.matrix
+        with self.lock:
+            version = catalog_version()
+            self.checked_at = time.monotonic()
+            if self.matrix is not None and version == self.version:
+                self.hits += 1
+                return self.matrix
+            self.misses += 1
+            start = time.perf_counter()
+            self.matrix = load_features()
+            self.matrix.version = version
+            if motoapi.config['RECOMMENDATION_ENGINE'] == 'kdtree':
+                self.matrix.get_index()
+            self.version = version
+            self.build_time = time.perf_counter() - start
+            motoapi.logger.info('Catalog cache rebuilt: %s', self.stats())
+            return self.matrix
+
+
+catalog_cache = CatalogCache()
+# Serialized recommendation responses, keyed by catalog version
+recommendation_cache = LRUCache(
+    motoapi.config['RECOMMENDATION_CACHE_SIZE'],
+    motoapi.config['RECOMMENDATION_CACHE_TTL'])
+
+
+class ShufflePool:
+    """Shuffled ids of every successfully fetched variation, reshuffled every
+    COLD_START_POOL_INTERVAL seconds. Each user walks it from their own
+    offset, so cold start picks need neither ORDER BY random() nor repeats
+    between consecutive calls.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.ids = None
+        self.shuffled_at = 0
+        self.offsets = {}
+
+    def get_ids(self):
+        interval = motoapi.config['COLD_START_POOL_INTERVAL']
+        if (self.ids is not None
+                and time.monotonic() - self.shuffled_at < interval):
+            return self.ids
+        with self.lock:
+            rows = db.session.execute(select([Variation.id]).where(
+                Variation.fetch_state == 'success')).fetchall()
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            np.random.shuffle(ids)
+            self.ids = ids
+            self.shuffled_at = time.monotonic()
+            self.offsets = {}
+            return self.ids
+
+    def sample(self, user_id, k, exclude=()):
+        """Returns the next k ids of the pool for the user.
+        :param exclude: Ids to skip, e.g. the ones the user already swiped
+        """
+        ids = self.get_ids()
+        if not len(ids):
+            return []
+        offset = self.offsets.get(user_id)
+        if offset is None:
+            offset = random.randrange(len(ids))
+        picked = []
+        for step in range(len(ids)):
+            variant_id = int(ids[(offset + step) % len(ids)])
+            if variant_id not in exclude:
+                picked.append(variant_id)
+            if len(picked) == k:
+                break
+        self.offsets[user_id] = (offset + step + 1) % len(ids)
+        return picked
+
+
+cold_start_pool = ShufflePool()
@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy, SignallingSession
+from sqlalchemy import event, exc, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import Select, CompoundSelect
+
+from motoapi.cache import LRUCache
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PoolStats:
+    """Connection checkout counters shared by every pool of the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.wait_time = 0
+        self.max_wait_time = 0
+
+    def record(self, wait_time):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+
+pool_stats = PoolStats()
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long every connection checkout waited"""
+
+    def _metered(self, checkout):
+        start = time.perf_counter()
+        try:
+            return checkout()
+        finally:
+            pool_stats.record(time.perf_counter() - start)
+
+    def connect(self):
+        return self._metered(super().connect)
+
+    def unique_connection(self):
+        # What Engine.connect() checks out through
+        return self._metered(super().unique_connection)
+
+
+class RoutingSession(SignallingSession):
+    """Sends the SELECTs of read-only requests to the replica bind. Anything
+    else, and every query after the session wrote, goes to the primary.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        self.wrote = False
+        self.primary_only = False
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self.wrote and not self.primary_only and not self._flushing
+                and isinstance(clause, (Select, CompoundSelect))
+                and self.db.use_replica()):
+            return self.db.get_engine(self.app, bind='replica')
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def after_flush(session, flush_context):
+    session.wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def after_commit(session):
+    if session.wrote:
+        session.db.pin_to_primary()
+
+
+class SQLAlchemy(_SQLAlchemy):
+    """Keeps a real connection pool per worker process instead of the
+    connection per request the app used to dispose after every response.
+    With DATABASE_GEVENT the sessions are scoped to greenlets and psycopg2
+    waits on the gevent hub instead of blocking it. With a replica bind in
+    SQLALCHEMY_BINDS, read-only requests read from it.
+    """
+
+    def __init__(self, app=None, **kwargs):
+        self.cooperative = bool(app and app.config.get('DATABASE_GEVENT'))
+        # Users that wrote recently, they read their own writes from the
+        # primary until the replica caught up
+        self.recent_writers = LRUCache(10000,
+            app.config.get('REPLICA_STICKY_SECONDS') if app else None)
+        super().__init__(app, **kwargs)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def use_replica(self):
+        """Whether the current request may read from the replica"""
+        app = self.get_app()
+        if ('replica' not in (app.config.get('SQLALCHEMY_BINDS') or {})
+                or not has_request_context()
+                or request.method not in READ_ONLY_METHODS):
+            return False
+        identity = get_jwt_identity()
+        return identity is None or self.recent_writers.get(identity) is None
+
+    def pin_to_primary(self, identity=None):
+        """Makes the current user, or the user of identity, read from the
+        primary for the next REPLICA_STICKY_SECONDS, so they see what they
+        just wrote.
+        """
+        if identity is None and has_request_context():
+            identity = get_jwt_identity()
+        if identity is not None:
+            self.recent_writers.set(identity, True)
+
+    @contextmanager
+    def primary(self):
+        """Runs the queries of the block on the primary"""
+        session = self.session()
+        primary_only, session.primary_only = session.primary_only, True
+        try:
+            yield session
+        finally:
+            session.primary_only = primary_only
+
+    def create_scoped_session(self, options=None):
+        options = dict(options or {})
+        if self.cooperative:
+            from greenlet import getcurrent
+            options.setdefault('scopefunc', getcurrent)
+        return super().create_scoped_session(options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        if self.cooperative and sa_url.drivername.startswith('postgres'):
+            make_psycopg_green()
+            # Greenlets queue for a connection on the patched pool lock
+            options.setdefault(
+                'pool_size', app.config['DATABASE_GEVENT_POOL_SIZE'])
+            options.setdefault('max_overflow', 0)
+        # sqlite keeps flask_sqlalchemy's NullPool, there is nothing to pool
+        if not sa_url.drivername.startswith('sqlite'):
+            options.setdefault('poolclass', MeteredQueuePool)
+            options.setdefault('pool_size', app.config['DATABASE_POOL_SIZE'])
+            options.setdefault(
+                'max_overflow', app.config['DATABASE_MAX_OVERFLOW'])
+            options.setdefault(
+                'pool_timeout', app.config['DATABASE_POOL_TIMEOUT'])
+            options.setdefault(
+                'pool_recycle', app.config['DATABASE_POOL_RECYCLE'])
+            options.setdefault('pool_pre_ping', True)
+        if sa_url.drivername in ('postgresql', 'postgresql+psycopg2'):
+            # executemany() of an INSERT sends multi-row VALUES batches
+            options.setdefault('executemany_mode', 'values')
+        return super().apply_driver_hacks(app, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        make_fork_safe(engine)
+        return engine
+
+    def pool_status(self):
+        pool = self.engine.pool
+        status = {
+            'pool': type(pool).__name__,
+            'cooperative': self.cooperative,
+            'checkouts': pool_stats.checkouts,
+            'wait_time': pool_stats.wait_time,
+            'max_wait_time': pool_stats.max_wait_time,
+        }
+        if isinstance(pool, QueuePool):
+            status.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+            })
+        return status
+
+
+def make_fork_safe(engine):
+    """Discards pooled connections inherited from a parent process instead of
+    sharing their sockets, which is what made libpq fail with "error with
+    no message" once uWSGI forked the workers.
+    """
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                'Connection record belongs to pid %s, attempting to check '
+                'out in pid %s' % (connection_record.info['pid'], pid))
+
+
+def make_psycopg_green():
+    """Makes psycopg2 wait for the server on the gevent hub, like psycogreen
+    does, so a slow query only blocks its own greenlet.
+    """
+    from gevent import monkey
+    from psycopg2 import extensions
+
+    if not monkey.is_module_patched('threading'):
+        # The pool lock would block the hub while greenlets wait for it
+        raise RuntimeError('DATABASE_GEVENT needs a gevent monkey patched '
+            'process, e.g. uWSGI gevent-early-monkey-patch')
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def gevent_wait_callback(connection, timeout=None):
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import extensions, OperationalError
+
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(connection.fileno(), timeout=timeout)
+        else:
+            raise OperationalError('Bad result from poll: %r' % state)
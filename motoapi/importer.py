@@ -0,0 +1,108 @@
+import time
+
+from sqlalchemy.sql import select
+
+from motoapi import db
+from motoapi.models import Brand, Variation
+
+
+def parse_version(row, brands):
+    """Maps a source version row to Variation column values, None when the
+    row can't be imported.
+    :param row: (id, name, _, year, fuel, price, brand name) like the
+        versions ⋈ brands query of import_data returns
+    :param brands: {brand name: brand id}
+    """
+    brand_id = brands.get(row[6])
+    if brand_id is None:
+        return None
+    name, _, rest = row[1].partition(' (')
+    try:
+        model_year = int(rest[0:4])
+    except ValueError:
+        return None
+    return {
+        'name': name.strip(),
+        'brand_id': brand_id,
+        'model_year': model_year,
+        'year': row[3],
+        'price': row[5],
+    }
+
+
+def import_brands(names):
+    """Inserts the brands that don't exist yet and returns the
+    {brand name: brand id} map of every brand.
+    """
+    brands = dict(db.session.execute(
+        select([Brand.name, Brand.id])).fetchall())
+    missing = set(names) - set(brands)
+    if missing:
+        db.session.execute(Brand.__table__.insert(),
+            [{'name': name} for name in sorted(missing)])
+        db.session.commit()
+        brands = dict(db.session.execute(
+            select([Brand.name, Brand.id])).fetchall())
+    return brands
+
+
+class VersionImporter:
+    """Imports source versions into Variation in chunks. Brands are resolved
+    through an in-memory map and names already in the catalog are skipped
+    with a set, so rerunning an interrupted import only adds what's missing.
+    :param brands: {brand name: brand id}
+    :param chunk_size: Rows inserted and committed at once
+    :param report: Called with the progress after every chunk
+    """
+
+    def __init__(self, brands, chunk_size=5000, report=None):
+        self.brands = brands
+        self.chunk_size = chunk_size
+        self.report = report
+        self.names = {name for name, in db.session.execute(
+            select([Variation.name]))}
+        self.read = 0
+        self.imported = 0
+        self.last_id = None
+        self.started_at = None
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at
+        return {
+            'read': self.read,
+            'imported': self.imported,
+            'skipped': self.read - self.imported,
+            'rows_per_second': self.read / elapsed if elapsed else 0,
+            'last_id': self.last_id,
+        }
+
+    def flush(self, rows):
+        if rows:
+            db.session.execute(Variation.__table__.insert(), rows)
+            db.session.commit()
+            self.imported += len(rows)
+
+    def run(self, rows):
+        """Imports the source rows, ordered by id so the last_id of a
+        progress report can resume an interrupted import.
+        """
+        self.started_at = time.monotonic()
+        chunk = []
+        for row in rows:
+            self.read += 1
+            self.last_id = row[0]
+            version = parse_version(row, self.brands)
+            if version is not None and version['name'] not in self.names:
+                self.names.add(version['name'])
+                chunk.append(version)
+            # Every row read so far is committed when last_id is reported
+            if self.read % self.chunk_size == 0:
+                self.flush(chunk)
+                chunk = []
+                if self.report is not None:
+                    self.report(self.stats())
+        self.flush(chunk)
+        stats = self.stats()
+        if self.report is not None:
+            self.report(stats)
+        return stats
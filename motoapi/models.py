@@ -3,19 +3,23 @@ import hmac
 import base64
 import hashlib
 from bs4 import BeautifulSoup
-from passlib.hash import pbkdf2_sha512 as sha512
 import datetime
 import random
 import string
+import uuid
 from sqlalchemy.sql import func
 from flask_sqlalchemy import BaseQuery
 from sqlalchemy.sql import func
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
 from sqlalchemy.ext.declarative import declared_attr
-from re import sub
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.types import TypeDecorator
+from re import sub, search
 
 
 from motoapi import db
+from motoapi.passwords import hash_pool, hasher, verify_and_update
 from config import Config
 
 
@@ -32,6 +36,33 @@ def snake_case(s):
         s.replace('-', ' '))).split()).lower()
 
 
+def parse_feature(feature, value):
+    """Parses a bikez spec string (e.g. "98.0 HP (71.5  kW))") into the
+    numeric value stored in the Variation feature columns.
+    :param feature: One of Variation.FEATURES
+    :param value: The raw value scraped into extra_data
+    """
+    if feature in ['year', 'model_year']:
+        return value
+    if feature == 'valves_per_cylinder':
+        return int(value)
+    if feature in ['displacement', 'top_speed', 'fuel_capacity', 'weight']:
+        return float(value.split()[0])
+    if feature == 'power':
+        if 'kW' not in value:
+            return float(value.split()[0])
+        return float(search(r'(\d+\.\d+)\s*kW', value).group(1))
+    if feature == 'category':
+        try:
+            value = int(value)
+        except ValueError:
+            return Variation.CATEGORIES.index(value)
+        if not 0 <= value < len(Variation.CATEGORIES):
+            raise ValueError('Unknown category %s' % value)
+        return value
+    raise ValueError('Empty')
+
+
 def get_hmac(password):
     salt = Config.PASSWORD_SALT
     if salt is None:
@@ -79,6 +110,28 @@ class QueryWithSoftDelete(BaseQuery):
             self._with_deleted or not obj.deleted else None)
 
 
+class JTI(TypeDecorator):
+    """The uuid of a JWT, stored in 16 bytes instead of its 36 characters.
+    Postgres gets its native uuid type, the others a fixed width binary.
+    """
+    impl = db.LargeBinary(16)
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID())
+        return dialect.type_descriptor(self.impl)
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return uuid.UUID(value).bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return str(uuid.UUID(bytes=value))
+
+
 class TimestampsMixin(object):
     updated_at = db.Column(
         db.DateTime,
@@ -93,11 +146,65 @@ class TimestampsMixin(object):
 
 class Brand(db.Model, TimestampsMixin):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, index=True)
     variations = db.relationship('Variation', backref='brand', lazy=True)
 
 
 class Variation(db.Model, TimestampsMixin):
+    CATEGORIES = [
+        'Unspecified category',
+        'Classic',
+        'Custom / cruiser',
+        'Touring',
+        'Allround',
+        'Naked bike',
+        'Sport',
+        'Sport touring',
+    ]
+    # Numeric features used by the recommendation engine
+    FEATURES = [
+        'model_year',
+        'displacement',
+        'top_speed',
+        'power',
+        'fuel_capacity',
+        'weight',
+        'valves_per_cylinder',
+        'category',
+    ]
+    # Typed columns the variant list can be filtered by range
+    RANGE_FILTERS = [
+        'model_year',
+        'displacement',
+        'top_speed',
+        'power',
+        'fuel_capacity',
+        'weight',
+        'price',
+    ]
+    # extra_data key each parsed feature column is filled from
+    FEATURE_KEYS = {
+        'displacement': 'displacement',
+        'top_speed': 'top_speed',
+        'power': 'power',
+        'fuel_capacity': 'fuel_capacity',
+        'weight': 'weight_incl._oil,_gas,_etc',
+        'valves_per_cylinder': 'valves_per_cylinder',
+        'category': 'category',
+    }
+    # Every listed variation is fetched, so fetch_state leads the spec
+    # filter indexes
+    __table_args__ = (
+        db.Index('ix_variation_fetch_state_category_displacement',
+            'fetch_state', 'category', 'displacement'),
+        db.Index('ix_variation_fetch_state_displacement',
+            'fetch_state', 'displacement'),
+        db.Index('ix_variation_fetch_state_power', 'fetch_state', 'power'),
+        db.Index('ix_variation_fetch_state_price', 'fetch_state', 'price'),
+        db.Index('ix_variation_brand_id_displacement',
+            'brand_id', 'displacement'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     year = db.Column(db.Integer)
@@ -109,6 +216,15 @@ class Variation(db.Model, TimestampsMixin):
     fetch_state = db.Column(db.String)
     fetch_date = db.Column(db.DateTime)
 
+    # Parsed from extra_data by update_features
+    displacement = db.Column(db.Float)
+    top_speed = db.Column(db.Float)
+    power = db.Column(db.Float)
+    fuel_capacity = db.Column(db.Float)
+    weight = db.Column(db.Float)
+    valves_per_cylinder = db.Column(db.Integer)
+    category = db.Column(db.Integer)
+
     brand_id = db.Column(db.Integer, db.ForeignKey('brand.id'),
         nullable=False)
 
@@ -173,19 +289,73 @@ class Variation(db.Model, TimestampsMixin):
                 if (i % 2 == 0 and (i + 1) < len(caracteristics)
                         and key not in ignored_data):
                     self.extra_data[key] = caracteristics[i + 1].getText()
+            self.update_features()
             self.fetch_date = datetime.datetime.now()
             self.fetch_state = "success"
         except (Exception) as e:
             self.fetch_state = "error"
 
+    def update_features(self):
+        """Fills the typed feature columns from extra_data, leaving the ones
+        that are missing or can't be parsed as None.
+        """
+        extra_data = self.extra_data or {}
+        for feature, key in Variation.FEATURE_KEYS.items():
+            try:
+                value = parse_feature(feature, extra_data[key])
+            except (KeyError, ValueError, TypeError, AttributeError):
+                value = None
+            setattr(self, feature, value)
+
 
 class TokenBlacklist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String, nullable=False)
+    jti = db.Column(JTI, nullable=False, unique=True, index=True)
     token_type = db.Column(db.String, nullable=False)
-    user_identity = db.Column(db.String, nullable=False)
+    user_identity = db.Column(db.String, nullable=False, index=True)
     revoked = db.Column(db.Boolean, nullable=False)
-    expires = db.Column(db.DateTime, nullable=False)
+    # Local time, like the exp claim add_token_to_database reads it from
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    @classmethod
+    def purge_expired(cls, batch_size=1000, now=None):
+        """Deletes the expired tokens, they fail the exp check before the
+        blacklist is read. Batches are picked through the expires index and
+        deleted by id, each in its own short transaction, so the jti lookups
+        of live tokens never wait on them. Returns the deleted rows.
+        """
+        now = now or datetime.datetime.now()
+        deleted = 0
+        while True:
+            ids = [token_id for token_id, in db.session.query(cls.id).filter(
+                cls.expires < now).order_by(cls.expires).limit(batch_size)]
+            if not ids:
+                return deleted
+            cls.query.filter(cls.id.in_(ids)).delete(
+                synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+
+    @classmethod
+    def table_stats(cls, now=None):
+        """Counts the rows and expired rows. size is the bytes of the table
+        and its indexes, None on databases we can't ask.
+        """
+        now = now or datetime.datetime.now()
+        rows, expired = db.session.query(
+            func.count(cls.id),
+            func.count(cls.id).filter(cls.expires < now)).one()
+        dialect = db.session.get_bind(cls.__mapper__).dialect.name
+        size = None
+        if dialect == 'postgresql':
+            size = db.session.execute(
+                "select pg_total_relation_size('token_blacklist')").scalar()
+        elif dialect == 'sqlite':
+            size = db.session.execute("""
+                select sum(pgsize) from dbstat where name in (
+                    select name from sqlite_master
+                    where tbl_name = 'token_blacklist')""").scalar()
+        return {'rows': rows, 'expired': expired, 'size': size}
 
     def to_dict(self):
         return {
@@ -233,6 +403,9 @@ class User(db.Model, TimestampsMixin):
         foreign_keys='DislikedVariant.user_id',
         backref='user', lazy='dynamic')
 
+    preference = db.relationship('UserPreference', uselist=False,
+        backref='user')
+
     @declared_attr
     def roles(cls):
         # The first arg is a class name, the backref is a column name
@@ -245,12 +418,21 @@ class User(db.Model, TimestampsMixin):
     @staticmethod
     def generate_hash(password):
         password = get_hmac(password)
-        return sha512.hash(password)
+        return hash_pool.run(hasher().hash, password)
 
     @staticmethod
     def verify_hash(password, hash):
         password = get_hmac(password)
-        return sha512.verify(password, hash)
+        return hash_pool.run(hasher().verify, password, hash)
+
+    @staticmethod
+    def verify_and_update(password, hash):
+        """Verifies the password against the hash. Returns (valid, new hash),
+        the new hash is None unless the hash was made with another cost than
+        PASSWORD_HASH_ROUNDS.
+        """
+        password = get_hmac(password)
+        return hash_pool.run(verify_and_update, password, hash)
 
     def __repr__(self):
         return '<User {}>'.format(self.id)
@@ -271,16 +453,211 @@ class Role(db.Model, TimestampsMixin):
 
 
 class LikedVariant(db.Model):
+    # A user swipes each variant at most once
+    __table_args__ = (
+        db.Index('ix_liked_variant_user_id_variant_id', 'user_id', 'variant_id',
+            unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'),
         nullable=False)
     variant_id = db.Column(db.Integer, db.ForeignKey('variation.id'),
-        nullable=False)
+        nullable=False, index=True)
 
 
 class DislikedVariant(db.Model):
+    # A user swipes each variant at most once
+    __table_args__ = (
+        db.Index('ix_disliked_variant_user_id_variant_id', 'user_id', 'variant_id',
+            unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'),
         nullable=False)
     variant_id = db.Column(db.Integer, db.ForeignKey('variation.id'),
-        nullable=False)
+        nullable=False, index=True)
+
+
+class UserPreference(db.Model):
+    """Running sum of the features of the variations a user liked, their
+    average is the taste vector used by the swinger recommendations.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'),
+        primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    model_year = db.Column(db.Float, nullable=False, default=0)
+    displacement = db.Column(db.Float, nullable=False, default=0)
+    top_speed = db.Column(db.Float, nullable=False, default=0)
+    power = db.Column(db.Float, nullable=False, default=0)
+    fuel_capacity = db.Column(db.Float, nullable=False, default=0)
+    weight = db.Column(db.Float, nullable=False, default=0)
+    valves_per_cylinder = db.Column(db.Float, nullable=False, default=0)
+    category = db.Column(db.Float, nullable=False, default=0)
+
+    def add(self, variation):
+        """Adds a newly liked variation to the sums. Existing rows are
+        incremented in SQL so concurrent swipes don't lose updates.
+        """
+        if variation.fetch_state != 'success' or any(
+                getattr(variation, f) is None for f in Variation.FEATURES):
+            return
+        new = self.count is None
+        self.count = 1 if new else UserPreference.count + 1
+        for feature in Variation.FEATURES:
+            value = getattr(variation, feature)
+            setattr(self, feature, value if new else getattr(
+                UserPreference, feature) + value)
+
+    def get_average(self):
+        if not self.count:
+            return {}
+        return {feature: getattr(self, feature) / self.count
+                for feature in Variation.FEATURES}
+
+    @classmethod
+    def rebuild(cls, user_ids):
+        """Recomputes the sums of the given users from their likes.
+        :param user_ids: The users to rebuild, None rebuilds everyone
+        """
+        likes = db.session.query(
+            LikedVariant.user_id, LikedVariant.variant_id).distinct()
+        preferences = cls.query
+        if user_ids is not None:
+            likes = likes.filter(LikedVariant.user_id.in_(user_ids))
+            preferences = preferences.filter(cls.user_id.in_(user_ids))
+        likes = likes.subquery()
+        sums = db.session.query(
+            likes.c.user_id,
+            func.count(),
+            *[func.sum(getattr(Variation, f)) for f in Variation.FEATURES]
+        ).join(Variation, Variation.id == likes.c.variant_id).filter(
+            Variation.fetch_state == 'success',
+            *[getattr(Variation, f).isnot(None) for f in Variation.FEATURES]
+        ).group_by(likes.c.user_id)
+
+        preferences.delete(synchronize_session='fetch')
+        rebuilt = {user_id: cls(user_id=user_id, count=0)
+                   for user_id in (user_ids or [])}
+        for row in sums:
+            rebuilt[row[0]] = cls(user_id=row[0], count=row[1],
+                **dict(zip(Variation.FEATURES, row[2:])))
+        db.session.add_all(rebuilt.values())
+        return rebuilt
+
+
+def increment(model, key, column, **values):
+    """Adds one to the likes or dislikes column of the model row with the
+    key, and sets values, creating the row if there is none yet. Two first
+    swipes may both insert it, the one that loses the primary key race
+    increments the row of the other instead.
+    """
+    query = model.query.filter_by(**key)
+    changes = dict(values, **{column: getattr(model, column) + 1})
+    if query.update(changes, synchronize_session=False):
+        return
+    row = dict(key, likes=0, dislikes=0, **values)
+    row[column] = 1
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**row))
+    except IntegrityError:
+        query.update(changes, synchronize_session=False)
+
+
+class VariantStats(db.Model):
+    """Like and dislike counters of a variation, kept up to date by every
+    swipe so the dashboard doesn't recount the swipe tables.
+    """
+    variant_id = db.Column(db.Integer, db.ForeignKey('variation.id'),
+        primary_key=True)
+    likes = db.Column(db.Integer, nullable=False, default=0, index=True)
+    dislikes = db.Column(db.Integer, nullable=False, default=0, index=True)
+    last_swiped_at = db.Column(db.DateTime)
+
+    variant = db.relationship('Variation')
+
+    @classmethod
+    def record(cls, variation, liked):
+        """Counts a new swipe of the variation, and of its category, in the
+        current transaction. Existing rows are incremented in SQL so
+        concurrent swipes don't lose updates.
+        """
+        increment(cls, {'variant_id': variation.id},
+            'likes' if liked else 'dislikes',
+            last_swiped_at=datetime.datetime.utcnow())
+        CategoryStats.record(variation.category, liked)
+
+    @classmethod
+    def rebuild(cls):
+        """Recounts every variation and category from the swipe tables,
+        keeping the last_swiped_at the counters already had.
+        """
+        counts = {}
+        for likes, Swipe in [(True, LikedVariant), (False, DislikedVariant)]:
+            for variant_id, count in db.session.query(
+                    Swipe.variant_id, func.count()).group_by(
+                    Swipe.variant_id):
+                counts.setdefault(variant_id, [0, 0])[not likes] = count
+        stats = {stats.variant_id: stats for stats in cls.query}
+        for variant_id, stale in stats.items():
+            if variant_id not in counts:
+                db.session.delete(stale)
+        for variant_id, (likes, dislikes) in counts.items():
+            if variant_id not in stats:
+                stats[variant_id] = cls(variant_id=variant_id)
+                db.session.add(stats[variant_id])
+            stats[variant_id].likes = likes
+            stats[variant_id].dislikes = dislikes
+        CategoryStats.rebuild()
+        return counts
+
+
+class CategoryStats(db.Model):
+    """Like and dislike counters rolled up per variation category, the
+    variations without one are counted under UNCATEGORIZED.
+    """
+    UNCATEGORIZED = -1
+
+    category = db.Column(db.Integer, primary_key=True,
+        autoincrement=False)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    dislikes = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def record(cls, category, liked):
+        if category is None:
+            category = cls.UNCATEGORIZED
+        increment(cls, {'category': category},
+            'likes' if liked else 'dislikes')
+
+    @classmethod
+    def rebuild(cls):
+        """Recomputes the rollups from the VariantStats counters"""
+        category = func.coalesce(Variation.category, cls.UNCATEGORIZED)
+        rows = db.session.query(category, func.sum(VariantStats.likes),
+            func.sum(VariantStats.dislikes)).join(
+            Variation, Variation.id == VariantStats.variant_id).group_by(
+            category).all()
+        cls.query.delete()
+        db.session.add_all([
+            cls(category=category, likes=likes, dislikes=dislikes)
+            for category, likes, dislikes in rows])
+        return rows
+
+
+class CacheGeneration(db.Model):
+    """Counter that is bumped to invalidate the in-process caches of every
+    worker, they pick it up with their next catalog version probe.
+    """
+    name = db.Column(db.String(64), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, name):
+        generation = cls.query.get(name)
+        if generation is None:
+            db.session.add(cls(name=name, generation=1))
+        else:
+            generation.generation = cls.generation + 1
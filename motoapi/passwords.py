@@ -0,0 +1,122 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.hash import pbkdf2_sha512
+
+from motoapi import motoapi
+
+
+def hasher():
+    """pbkdf2_sha512 with the PASSWORD_HASH_ROUNDS cost, hashes of another
+    cost still verify and report that they need an update.
+    """
+    return pbkdf2_sha512.using(
+        rounds=motoapi.config['PASSWORD_HASH_ROUNDS'])
+
+
+def verify_and_update(password, hash):
+    """Returns (valid, new hash), the new hash is None unless the password
+    is valid and the hash was made with another cost.
+    """
+    handler = hasher()
+    if not handler.verify(password, hash):
+        return False, None
+    return True, handler.hash(password) if handler.needs_update(hash) \
+        else None
+
+
+def cooperative():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def check_cooperative():
+    """Warns when uWSGI runs gevent workers that weren't monkey patched, the
+    hashes would then block every greenlet of the worker.
+    """
+    try:
+        import uwsgi
+    except ImportError:
+        return
+    if uwsgi.opt.get('gevent') and not cooperative():
+        motoapi.logger.warning('uWSGI runs gevent but threading is not '
+            'monkey patched, password hashes block the worker. Set '
+            'gevent-early-monkey-patch.')
+
+
+class HashPool:
+    """Bounded pool of OS threads the password hashes run on, hashlib
+    releases the GIL while it derives the key. At most PASSWORD_HASH_POOL_SIZE
+    hashes run at once, the others wait in the queue. In a gevent monkey
+    patched worker it is a gevent ThreadPool, so a waiting request only
+    blocks its own greenlet. A size of 0 hashes in the calling thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.pending = 0
+        self.queue_time = 0
+        self.max_queue_time = 0
+
+    def stats(self):
+        return {
+            'size': motoapi.config['PASSWORD_HASH_POOL_SIZE'],
+            'calls': self.calls,
+            'pending': self.pending,
+            'queue_time': self.queue_time,
+            'average_queue_time':
+                self.queue_time / self.calls if self.calls else 0,
+            'max_queue_time': self.max_queue_time,
+        }
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                size = motoapi.config['PASSWORD_HASH_POOL_SIZE']
+                if cooperative():
+                    from gevent.threadpool import ThreadPool
+                    self.executor = ThreadPool(size)
+                else:
+                    self.executor = ThreadPoolExecutor(size,
+                        thread_name_prefix='password-hash')
+            return self.executor
+
+    def run(self, function, *args):
+        """Runs function(*args) on the pool and returns its result"""
+        submitted = time.monotonic()
+        started = []
+
+        def task():
+            started.append(time.monotonic())
+            return function(*args)
+
+        with self.lock:
+            self.pending += 1
+        try:
+            if not motoapi.config['PASSWORD_HASH_POOL_SIZE']:
+                return task()
+            executor = self.get_executor()
+            if cooperative():
+                return executor.spawn(task).get()
+            return executor.submit(task).result()
+        finally:
+            # Updated by the caller, gevent locks can't be shared with the
+            # pool threads
+            with self.lock:
+                self.pending -= 1
+                if started:
+                    queued = started[0] - submitted
+                    self.calls += 1
+                    self.queue_time += queued
+                    self.max_queue_time = max(self.max_queue_time, queued)
+
+
+hash_pool = HashPool()
+check_cooperative()
@@ -16,5 +16,4 @@ class MeResource(Resource):
     decorators = [jwt_required]
 
     def get(self):
-        user = current_user()
         return user_fields(current_user())
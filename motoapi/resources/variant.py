@@ -1,17 +1,32 @@
 from flask_restful import Resource, reqparse
 from flask_jwt_extended import jwt_required
 from flask import request
-from motoapi import db
-from motoapi.models import Variation, LikedVariant, DislikedVariant
-from motoapi.utils import current_user, query_with_paging, str2bool, abort
-from motoapi.fields import variant_fields, integer
+from sqlalchemy.exc import IntegrityError
+from motoapi import motoapi, db
+from motoapi.models import (Brand, Variation, LikedVariant, DislikedVariant,
+    UserPreference, VariantStats, CategoryStats, parse_feature)
+from motoapi.utils import (current_user, paged_response, str2bool, abort,
+    paging_parser, roles_required)
+from motoapi.fields import variant_fields, integer, string
+from motoapi.catalog import (catalog_cache, cold_start_pool,
+    recommendation_cache)
 from motoapi.utils import current_user
-from sqlalchemy.sql.expression import func, select
-import re
+from sqlalchemy.sql.expression import func, select, exists, and_, literal
+from sqlalchemy.orm import joinedload
+import numpy as np
 
 
 variant_parser = reqparse.RequestParser()
 variant_parser.add_argument('variant', type=integer())
+# Spec filters of the variant list, <column>_min and <column>_max are
+# inclusive bounds
+for column in Variation.RANGE_FILTERS:
+    variant_parser.add_argument(column + '_min', type=float)
+    variant_parser.add_argument(column + '_max', type=float)
+variant_parser.add_argument('category',
+    type=lambda value: parse_feature('category', value),
+    help="Category must be a category name or number")
+variant_parser.add_argument('brand', type=string(empty=False))
 
 tinder_parser = reqparse.RequestParser()
 tinder_parser.add_argument('variant', type=integer(), required=True)
@@ -24,49 +39,73 @@ class VariantResource(Resource):
     def get(self):
         args = variant_parser.parse_args()
         if args.variant:
-            variant = Variation.query.filter_by(id=args.variant).first()
+            variant = Variation.query.options(joinedload(
+                Variation.brand)).filter_by(id=args.variant).first()
             if not variant:
                 return abort(400, message='Variant not found')
             return variant_fields(variant)
-        return [variant_fields(v) for v in query_with_paging(
-            Variation.query.filter_by(fetch_state='success'))]
+        return paged_response(filter_variants(Variation.query.options(
+            joinedload(Variation.brand)).filter_by(fetch_state='success'),
+            args), variant_fields)
+
+
+def filter_variants(query, args):
+    """Applies the spec filters of the variant_parser args to a Variation
+    query as plain column predicates, so they can use the spec indexes.
+    """
+    for column in Variation.RANGE_FILTERS:
+        if args[column + '_min'] is not None:
+            query = query.filter(
+                getattr(Variation, column) >= args[column + '_min'])
+        if args[column + '_max'] is not None:
+            query = query.filter(
+                getattr(Variation, column) <= args[column + '_max'])
+    if args.category is not None:
+        query = query.filter(Variation.category == args.category)
+    if args.brand:
+        # Resolved first, the planner estimates constant ids far better
+        # than a subquery
+        brand_ids = [brand_id for brand_id, in db.session.query(
+            Brand.id).filter(Brand.name == args.brand)]
+        query = query.filter(Variation.brand_id.in_(brand_ids))
+    return query
+
+def get_average_preferences(user):
+    preference = user.preference
+    if preference is None:
+        # Users that liked bikes before preferences were persisted
+        preference = UserPreference.rebuild([user.id])[user.id]
+        db.session.commit()
+    return preference.get_average()
+
+def get_seen_variants(user):
+    """Returns the sorted ids of every variant the user swiped, with one
+    query, and whether any of them was liked.
+    """
+    rows = db.session.query(
+        LikedVariant.variant_id, literal(1)
+    ).filter(LikedVariant.user_id == user.id).union_all(
+        db.session.query(DislikedVariant.variant_id, literal(0)).filter(
+            DislikedVariant.user_id == user.id)).all()
+    seen = np.unique(np.array([row[0] for row in rows], dtype=np.int64))
+    return seen, any(row[1] for row in rows)
 
-def get_average_preferences(ids_liked):
-    handler = AttributeHandler(None, None)
-    fill_handler(handler, variations=Variation.query.filter(
-        Variation.id.in_(ids_liked)).all())
-    return handler.get_average_bikes()
 
 def tinder_recommendation():
-    ids_liked = set()
-    for like in LikedVariant.query.filter_by(user_id=current_user().id):
-        ids_liked.add(like.variant_id)
-    id_disliked = set()
-    for like in DislikedVariant.query.filter_by(user_id=current_user().id):
-        id_disliked.add(like.variant_id)
-    
-    LIMIT = 5
-    if not ids_liked:
-        variations = Variation.query.filter_by(fetch_state="success").order_by(func.random()).limit(150)
-        response = [variant_fields(v) for v in variations]
-        # print('bbb')
-    else:
-        preferences = get_average_preferences(ids_liked)
-        # print('ccc', len(preferences))
-        response = recommendation_response(preferences, limit=None)
-    filtered_response = []
-    for item in response:
-        id = item['id']
-        if (id in ids_liked) or (id in id_disliked):
-            continue
-        filtered_response.append(item)
-    # print('aaaa', len(filtered_response))
-    # print(filtered_response, response)
-    filtered_response = filtered_response[:LIMIT]
-    # print(list(map(lambda x: x['id'], filtered_response)), ids_liked, id_disliked)
-    return filtered_response
+    user = current_user()
+    seen, has_likes = get_seen_variants(user)
 
+    LIMIT = 5
+    if has_likes:
+        preferences = get_average_preferences(user)
+        return recommendation_fields(get_recommendations(
+            preferences, limit=LIMIT, exclude=seen))
 
+    ids = cold_start_pool.sample(user.id, LIMIT, exclude=set(seen.tolist()))
+    variants = {v.id: v for v in Variation.query.options(
+        joinedload(Variation.brand)).filter(
+        Variation.id.in_(ids), Variation.fetch_state == 'success')}
+    return [variant_fields(variants[i]) for i in ids if i in variants]
 
 
 recommendation_parser = reqparse.RequestParser()
@@ -82,170 +121,72 @@ recommendation_parser.add_argument('category', type=integer())
 
 
 class AttributeHandler:
-    CATEGORIES = [
-        'Unspecified category',
-        'Classic',
-        'Custom / cruiser',
-        'Touring',
-        'Allround',
-        'Naked bike',
-        'Sport',
-        'Sport touring',
-    ]
-
-    def __init__(self, list_attributes, preference):
-        self.list_attributes = list_attributes
-        self.min_attributes = {}
-        self.max_attributes = {}
+
+    def __init__(self, preference):
         self.preference = preference
-        self.bikes = {}
-
-    def _parse_attribute(self, attr, value):
-        if attr == 'weight_incl._oil,_gas,_etc':
-            attr = 'weight'
-        if attr in ['year', 'model_year']:
-            return attr, value
-        if 'displacement' == attr:
-            return attr, float(value.split()[0])
-        if 'valves_per_cylinder' == attr:
-            return attr, int(value)
-        if attr in ['top_speed', 'fuel_capacity', 'weight']:
-            return attr, float(value.split()[0])
-        if 'power' == attr:
-            if 'kW' not in value:
-                return attr, float(value.split()[0])
-            value = float(re.search('(\d+\.\d+)\s*kW', value).group(1))
-            return attr, value
-        if 'category' == attr:
-            CAT_IN = AttributeHandler.CATEGORIES
-            try:
-                value = int(value)
-            except:
-                return attr, CAT_IN.index(value)
-            assert 0 <= value
-            assert value < len(CAT_IN)
-            return attr, value
-        raise ValueError('Empty')
-
-    def get_average_bikes(self):
-        response = {}
-        for attr in self.min_attributes:
-            avg = 0
-            for bike in self.bikes.values():
-                avg += bike[attr]
-            avg /= len(self.bikes)
-            response[attr] = avg
-        return response
+        self.matrix = None
 
-    def add_attribute(self, id, attribute, value):
-        attribute, value = self._parse_attribute(attribute, value)
-        if self.list_attributes is not None and attribute not in self.list_attributes:
-            return
-        if attribute not in self.min_attributes:
-            self.min_attributes[attribute] = value
-            self.max_attributes[attribute] = value
-        else:
-            self.min_attributes[attribute] = min(
-                self.max_attributes[attribute], value)
-            self.max_attributes[attribute] = max(
-                self.max_attributes[attribute], value)
-        if id not in self.bikes:
-            self.bikes[id] = {}
-        self.bikes[id][attribute] = value
-
-    @staticmethod
-    def check_all_attributes(obj, attributes):
-        for attr in attributes:
-            if getattr(obj, attr) is None:
-                return False
-        return True
-
-    @staticmethod
-    def check_all_index(obj, attributes):
-        for attr in attributes:
-            if attr not in obj or obj[attr] is None:
-                return False
-        return True
-
-    def get_recommendations(self):
-        distance_d = []
-        min_distance = 99999999
-        max_distance = 0
-        for i, (bike_id, bike) in enumerate(self.bikes.items()):
-            distance = 0
-            for attr in self.list_attributes:
-                mx = self.max_attributes[attr]
-                mn = self.min_attributes[attr]
-
-                def clap(value):
-                    num = (value - mn)
-                    div = (mx - mn)
-                    if div != 0:
-                        num /= div
-                    return num
-                clap_bike = clap(bike[attr])
-                clap_preference = clap(self.preference[attr])
-                difference = abs(clap_bike - clap_preference)
-                distance += difference
-            min_distance = min(min_distance, distance)
-            max_distance = max(max_distance, distance)
-            distance_d.append((bike_id, distance))
-
-        for i in range(len(distance_d)):
-            bike_id, distance = distance_d[i]
-            div = (max_distance - min_distance)
-            if div == 0: div = 1
-            distance = ((distance - min_distance) / div) * 100
-            distance_d[i] = bike_id, distance
-
-        distance_d.sort(key=lambda x: x[1], reverse=True)
-        return distance_d
-
-
-def fill_handler(handler, variations=None):
-    attrs = ['model_year']
-    extra_attr = [
-        'displacement',
-        'top_speed',
-        'power',
-        'fuel_capacity',
-        'weight_incl._oil,_gas,_etc',
-        'valves_per_cylinder',
-        'category'
-    ]
-    if variations is None:
-        variations = Variation.query.filter_by(fetch_state='success')
-    for variation in variations:
-        if not AttributeHandler.check_all_attributes(variation, attrs):
-            continue
-        if (variation.extra_data is None
-                or not AttributeHandler.check_all_index(
-                    variation.extra_data, extra_attr)):
-            continue
-        for attr in attrs:
-            handler.add_attribute(
-                variation.id, attr, getattr(variation, attr))
-        for attr in extra_attr:
-            handler.add_attribute(
-                variation.id, attr, variation.extra_data[attr])
-
-def recommendation_response(preference, limit=50):
-    handler = AttributeHandler(preference.keys(), preference)
-    fill_handler(handler)
-    recommendations = handler.get_recommendations()
-    if limit is not None:
-        recommendations = recommendations[:limit]
-    ids = list(map(lambda x: x[0], recommendations))
-    recommendations = {k: v for k, v in recommendations}
-    recommendations_obj = Variation.query.filter(
-        Variation.id.in_(ids)).all()
-
-    response = []
-    for obj in recommendations_obj:
-        fields = variant_fields(obj)
-        fields['matching'] = recommendations[obj.id]
-        response.append(fields)
+    def get_recommendations(self, limit=None, offset=0, use_index=False,
+            exclude=None):
+        return self.matrix.rank(self.preference, limit=limit,
+            offset=offset, use_index=use_index, exclude=exclude)
 
+
+def fill_handler(handler):
+    """Sets the handler matrix to the typed features of every variation that
+    has all of them, from the process wide catalog cache.
+    """
+    handler.matrix = catalog_cache.get()
+
+
+def get_recommendations(preference, limit=50, offset=0, exclude=None,
+        matrix=None):
+    handler = AttributeHandler(preference)
+    if matrix is None:
+        fill_handler(handler)
+    else:
+        handler.matrix = matrix
+    return handler.get_recommendations(limit=limit, offset=offset,
+        use_index=motoapi.config['RECOMMENDATION_ENGINE'] == 'kdtree',
+        exclude=exclude)
+
+
+def recommendation_fields(recommendations):
+    """Serializes (variant_id, matching) pairs keeping their ranking"""
+    return batch_recommendation_fields([recommendations])[0]
+
+
+def batch_recommendation_fields(rankings):
+    """Serializes several rankings, loading and serializing every variant
+    only once however many rankings it appears in.
+    """
+    ids = set(r[0] for recommendations in rankings for r in recommendations)
+    if not ids:
+        return [[] for _ in rankings]
+    fields = {v.id: variant_fields(v) for v in Variation.query.options(
+        joinedload(Variation.brand)).filter(Variation.id.in_(ids))}
+    return [
+        [dict(fields[variant_id], matching=matching)
+         for variant_id, matching in recommendations]
+        for recommendations in rankings]
+
+
+def recommendation_response(preference, limit=50, offset=0):
+    """Returns the serialized recommendations, going through the result
+    cache keyed by the canonical (and quantized) preference.
+    """
+    quantum = motoapi.config['RECOMMENDATION_CACHE_QUANTUM']
+    preference = {
+        k: round(preference[k] / quantum) * quantum if quantum
+        else preference[k]
+        for k in Variation.FEATURES if k in preference}
+    matrix = catalog_cache.get()
+    key = (matrix.version, tuple(preference.items()), limit, offset)
+    response = recommendation_cache.get(key)
+    if response is None:
+        response = recommendation_fields(get_recommendations(
+            preference, limit=limit, offset=offset, matrix=matrix))
+        recommendation_cache.set(key, response)
     return response
 
 class Recommendation(Resource):
@@ -254,7 +195,85 @@ class Recommendation(Resource):
 
     def get(self):
         args = recommendation_parser.parse_args()
-        return recommendation_response({k: float(v) for k, v in request.args.items()})
+        paging_args = paging_parser.parse_args()
+        preference = {k: float(v) for k, v in request.args.items()
+                      if args.get(k) is not None}
+        if not preference:
+            # Nothing to rank by
+            return []
+        if paging_args.page_size:
+            return recommendation_response(preference,
+                limit=paging_args.page_size,
+                offset=(paging_args.page or 0) * paging_args.page_size)
+        return recommendation_response(preference)
+
+
+class RecommendationStats(Resource):
+
+    decorators = [roles_required('admin'), jwt_required]
+
+    def get(self):
+        return {
+            'catalog': catalog_cache.stats(),
+            'results': recommendation_cache.stats(),
+        }
+
+
+batch_parser = reqparse.RequestParser()
+batch_parser.add_argument('preferences', type=list, location='json',
+    required=True, help="Preferences cannot be blank!")
+batch_parser.add_argument('limit', type=integer(allow_negative=False),
+    location='json')
+
+
+class RecommendationBatch(Resource):
+
+    def post(self):
+        args = batch_parser.parse_args()
+        preferences = []
+        for preference in args.preferences:
+            if not isinstance(preference, dict):
+                return abort(400, message='Every preference must be an object')
+            try:
+                preferences.append({k: float(v) for k, v in preference.items()
+                                    if k in Variation.FEATURES})
+            except (TypeError, ValueError):
+                return abort(400, message='Preference values must be numbers')
+        if not preferences:
+            return []
+        limit = 50 if args.limit is None else args.limit
+        # Like the GET, a preference without known features ranks nothing
+        ranked = iter(catalog_cache.get().rank_many(
+            [preference for preference in preferences if preference],
+            limit=limit))
+        return batch_recommendation_fields(
+            [next(ranked) if preference else [] for preference in preferences])
+
+def swiped(Swipe, user, variant):
+    """Whether the user already has a LikedVariant or DislikedVariant row for
+    the variant, swiping it again must not violate their unique index.
+    """
+    return db.session.query(exists().where(and_(
+        Swipe.user_id == user.id,
+        Swipe.variant_id == variant.id))).scalar()
+
+
+def add_swipe(Swipe, user, variant):
+    """Adds the LikedVariant or DislikedVariant row of the user for the
+    variant unless they already swiped it. A concurrent request may insert it
+    between the check and the insert, the unique index violation then counts
+    as already swiped.
+    Returns whether the row was added.
+    """
+    if swiped(Swipe, user, variant):
+        return False
+    try:
+        with db.session.begin_nested():
+            db.session.add(Swipe(variant_id=variant.id, user_id=user.id))
+    except IntegrityError:
+        return False
+    return True
+
 
 class TinderSwinger(Resource):
 
@@ -269,58 +288,55 @@ class TinderSwinger(Resource):
         if not variant:
             return abort(400, message="Variant not found")
         if args.liked:
-            db.session.add(LikedVariant(
-                variant=variant, user=current_user()))
+            user = current_user()
+            added = add_swipe(LikedVariant, user, variant)
+            if added:
+                VariantStats.record(variant, liked=True)
+            if user.preference is None:
+                UserPreference.rebuild([user.id])
+            elif added:
+                user.preference.add(variant)
         elif args.disliked:
-            db.session.add(DislikedVariant(
-                variant=variant, user=current_user()))
+            user = current_user()
+            if add_swipe(DislikedVariant, user, variant):
+                VariantStats.record(variant, liked=False)
         db.session.commit()
         return tinder_recommendation()
 
+def swipe_stats(column):
+    """Reads the swipe counters of the likes or dislikes column.
+    Returns the number of swipes, the most swiped variant with its count and
+    the swipes per variant category.
+    """
+    rollups = {stats.category: getattr(stats, column)
+               for stats in CategoryStats.query}
+    categories = {name: rollups.get(category, 0)
+                  for category, name in enumerate(Variation.CATEGORIES)}
+
+    count = getattr(VariantStats, column)
+    most = db.session.query(Variation, count).join(
+        VariantStats, VariantStats.variant_id == Variation.id).filter(
+        count > 0).order_by(count.desc(), VariantStats.variant_id).options(
+        joinedload(Variation.brand)).first()
+    return sum(rollups.values()), most, categories
+
+
 class DashBoard(Resource):
 
     # decorators = [jwt_required]
 
     def get(self):
-        from sqlalchemy import func
-        most_liked = LikedVariant.query.with_entities(LikedVariant.variant_id, func.count(LikedVariant.variant_id)).group_by(LikedVariant.variant_id).all()
-        most_liked.sort(key=lambda x: x[1])
-        most_liked, most_likes = most_liked[0]
-        most_liked = Variation.query.filter_by(id=most_liked).first()
-        most_liked = variant_fields(most_liked)
-        most_liked['likes'] = most_likes
-
-        most_disliked = DislikedVariant.query.with_entities(DislikedVariant.variant_id, func.count(DislikedVariant.variant_id)).group_by(DislikedVariant.variant_id).all()
-        most_disliked.sort(key=lambda x: x[1])
-        most_disliked, most_dislikes = most_disliked[0]
-        most_disliked = Variation.query.filter_by(id=most_disliked).first()
-        most_disliked = variant_fields(most_disliked)
-        most_disliked['dislikes'] = most_dislikes
-        all_cats = set()
-        def fill(d, ClsV):
-            for cat in AttributeHandler.CATEGORIES:
-                d[cat] = 0
-                st = db.session().query(
-                    Variation, 
-                    ClsV, 
-                ).filter(
-                    Variation.id == ClsV.variant_id
-                ).all()
-                for variation, liked_variation in st:
-                    if variation.extra_data is not None and 'category' in variation.extra_data:
-                        print('z')
-                        all_cats.add(variation.extra_data['category'])
-                        if variation.extra_data['category'] == cat:
-                            d[cat] += 1
-        like_cat = {}
-        fill(like_cat, LikedVariant)
-        dislike_cat = {}
-        fill(dislike_cat, DislikedVariant)
-        print(all_cats)
-        
+        num_likes, most_liked, like_cat = swipe_stats('likes')
+        num_dislikes, most_disliked, dislike_cat = swipe_stats('dislikes')
+        if most_liked:
+            most_liked = dict(variant_fields(most_liked[0]),
+                likes=most_liked[1])
+        if most_disliked:
+            most_disliked = dict(variant_fields(most_disliked[0]),
+                dislikes=most_disliked[1])
         response = {
-            'num_likes': len(LikedVariant.query.all()),
-            'num_dislikes': len(DislikedVariant.query.all()),
+            'num_likes': num_likes,
+            'num_dislikes': num_dislikes,
             'most_liked': most_liked,
             'most_disliked': most_disliked,
             'like_categories': like_cat,
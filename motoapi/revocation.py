@@ -0,0 +1,160 @@
+import threading
+import time
+
+from motoapi import motoapi, db
+from motoapi.cache import LRUCache
+from motoapi.models import TokenBlacklist, CacheGeneration
+
+
+def token_revoked(jti):
+    """Looks the token up in the blacklist table, tokens that aren't stored
+    are considered revoked as we don't know where they were created.
+    """
+    # Fresh tokens and revocations must not wait for the replica
+    with db.primary():
+        token = TokenBlacklist.query.filter_by(jti=jti).first()
+    return token.revoked if token else True
+
+
+def revocation_generation():
+    with db.primary():
+        return db.session.query(CacheGeneration.generation).filter(
+            CacheGeneration.name == 'revocation').scalar()
+
+
+class RevocationCache:
+    """Process wide cache in front of the token blacklist lookups. Known good
+    and revoked jtis live in separate LRUs, neither outlives the token
+    expiration and known good ones are rechecked every
+    REVOKED_TOKEN_CACHE_TTL seconds at most.
+
+    revoke_token and unrevoke_token invalidate the jti here and bump the
+    'revocation' CacheGeneration, the other workers clear their cache when
+    they see it change, probing it at most every
+    REVOKED_TOKEN_CACHE_INTERVAL seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.known_good = LRUCache(maxsize, ttl)
+        self.revoked = LRUCache(maxsize)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.known_good.clear()
+        self.revoked.clear()
+        self.generation = None
+        self.checked_at = 0
+        self.lookups = 0
+        self.database_lookups = 0
+        self.generation_probes = 0
+
+    def stats(self):
+        hits = self.lookups - self.database_lookups
+        return {
+            'lookups': self.lookups,
+            'hits': hits,
+            'hit_rate': hits / self.lookups if self.lookups else 0,
+            'database_lookups': self.database_lookups,
+            'generation_probes': self.generation_probes,
+            # The generation probes are round trips too
+            'avoided_lookups': hits - self.generation_probes,
+            'known_good': self.known_good.stats(),
+            'revoked': self.revoked.stats(),
+        }
+
+    def check_generation(self):
+        interval = motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL']
+        if time.monotonic() - self.checked_at < interval:
+            return
+        with self.lock:
+            generation = revocation_generation()
+            self.checked_at = time.monotonic()
+            self.generation_probes += 1
+            if generation != self.generation:
+                self.known_good.clear()
+                self.revoked.clear()
+                self.generation = generation
+
+    def is_revoked(self, decoded_token):
+        jti = decoded_token['jti']
+        self.lookups += 1
+        self.check_generation()
+        if self.revoked.get(jti) is not None:
+            return True
+        if self.known_good.get(jti) is not None:
+            return False
+        self.database_lookups += 1
+        revoked = token_revoked(jti)
+        expires_in = decoded_token['exp'] - time.time()
+        if expires_in > 0:
+            if revoked:
+                self.revoked.set(jti, True, ttl=expires_in)
+            else:
+                self.known_good.set(jti, True, ttl=min(
+                    expires_in, self.known_good.ttl))
+        return revoked
+
+    def invalidate(self, jti):
+        """Forgets the jti, call with the CacheGeneration bump of the change
+        so the other workers forget it too.
+        """
+        self.known_good.delete(jti)
+        self.revoked.delete(jti)
+
+
+class TokenPurger:
+    """Daemon thread that purges the expired tokens every
+    TOKEN_PURGE_INTERVAL seconds, for deployments without a scheduled
+    manage.py purge_tokens.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.runs = 0
+        self.deleted = 0
+        self.last_run = None
+        self.duration = 0
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'deleted': self.deleted,
+            'last_run': self.last_run,
+            'duration': self.duration,
+        }
+
+    def purge(self):
+        start = time.perf_counter()
+        with motoapi.app_context():
+            try:
+                deleted = TokenBlacklist.purge_expired(
+                    motoapi.config['TOKEN_PURGE_BATCH_SIZE'])
+            finally:
+                db.session.remove()
+        self.runs += 1
+        self.deleted += deleted
+        self.last_run = time.time()
+        self.duration = time.perf_counter() - start
+        motoapi.logger.info('Purged %s expired tokens', deleted)
+
+    def run(self):
+        while True:
+            time.sleep(motoapi.config['TOKEN_PURGE_INTERVAL'])
+            try:
+                self.purge()
+            except Exception:
+                motoapi.logger.exception('Expired token purge failed')
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+revocation_cache = RevocationCache(
+    motoapi.config['REVOKED_TOKEN_CACHE_SIZE'],
+    motoapi.config['REVOKED_TOKEN_CACHE_TTL'])
+token_purger = TokenPurger()
+if motoapi.config['TOKEN_PURGE_INTERVAL']:
+    token_purger.start()
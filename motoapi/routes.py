@@ -6,16 +6,18 @@ from flask import (render_template, redirect, url_for, request, jsonify,
     Blueprint)
 from flask_restful import reqparse
 # from flask_babelex import gettext as _
-from flask_jwt_extended import (jwt_required, create_access_token,
-    jwt_refresh_token_required, create_refresh_token, decode_token)
+from flask_jwt_extended import (jwt_required, jwt_refresh_token_required,
+    decode_token)
 
-from motoapi.utils import (abort, add_token_to_database, current_user,
+from motoapi.utils import (abort, issue_tokens, current_user,
     valid_email, valid_username, get_user_tokens, revoke_token, unrevoke_token,
     roles_accepted, roles_required, query_with_paging,
     get_random_integer, get_random_string)
 
 from motoapi import motoapi, db
 from motoapi.models import TokenBlacklist, User
+from motoapi.revocation import revocation_cache, token_purger
+from motoapi.passwords import hash_pool
 from motoapi.utils import (abort, current_user,
     valid_email, valid_username, query_with_paging)
 from motoapi.fields import user_fields, string
@@ -53,21 +55,42 @@ def index():
     return {'ping': 'pong'}
 
 
+@api_blueprint.route('/stats/database')
+@jwt_required
+@roles_required('admin')
+def database_stats():
+    return jsonify(db.pool_status())
+
+
+@api_blueprint.route('/stats/tokens')
+@jwt_required
+@roles_required('admin')
+def token_stats():
+    return jsonify(dict(revocation_cache.stats(),
+        purge=token_purger.stats()))
+
+
+@api_blueprint.route('/stats/passwords')
+@jwt_required
+@roles_required('admin')
+def password_stats():
+    return jsonify(hash_pool.stats())
+
+
 @api_blueprint.route('/auth/login', methods=['POST'])
 def login():
     args = login_parser.parse_args()
     user = User.query.filter_by(username=args.username).first()
     if not user:
         return abort(400, message="Bad username or password", error_code=204)
-    if not User.verify_hash(args.password, user.password):
+    valid, new_hash = User.verify_and_update(args.password, user.password)
+    if not valid:
         return abort(400, message="Bad username or password", error_code=204)
+    if new_hash:
+        # Hashed with another PASSWORD_HASH_ROUNDS, committed with the tokens
+        user.password = new_hash
 
-    access_token = create_access_token(identity=user.id)
-    refresh_token = create_refresh_token(identity=user.id)
-    add_token_to_database(access_token,
-        motoapi.config['JWT_IDENTITY_CLAIM'])
-    add_token_to_database(refresh_token,
-        motoapi.config['JWT_IDENTITY_CLAIM'])
+    access_token, refresh_token = issue_tokens(user.id)
     return jsonify(
         user=user_fields(user),
         access_token=access_token,
@@ -123,9 +146,7 @@ def register():
 def refresh():
     # Do the same thing that we did in the login endpoint here
     user = current_user()
-    access_token = create_access_token(identity=user.id)
-    add_token_to_database(access_token,
-        motoapi.config['JWT_IDENTITY_CLAIM'])
+    access_token, = issue_tokens(user.id, refresh=False)
     return jsonify({
         'access_token': access_token,
         'refresh_token': request.headers.get('Authorization')[7:],
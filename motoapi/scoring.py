@@ -0,0 +1,303 @@
+import heapq
+from itertools import repeat
+from operator import itemgetter, sub
+
+import numpy as np
+
+
+class FeatureMatrix:
+    """Dense (n_bikes, n_attributes) float matrix of the catalog features,
+    min/max normalized once so every query is scored with array operations.
+    :param ids: The variation ids, one per row
+    :param attributes: The attribute names, one per column
+    :param values: Anything convertible to a (len(ids), len(attributes))
+        float array
+    """
+
+    def __init__(self, ids, attributes, values):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.attributes = list(attributes)
+        self.values = np.asarray(values, dtype=np.float64).reshape(
+            len(self.ids), len(self.attributes))
+        if len(self.ids):
+            self.min = self.values.min(axis=0)
+            self.max = self.values.max(axis=0)
+        else:
+            self.min = np.zeros(len(self.attributes))
+            self.max = np.zeros(len(self.attributes))
+        # Constant columns are only shifted, like the original clap() did
+        self.span = self.max - self.min
+        self.span[self.span == 0] = 1
+        self.normalized = (self.values - self.min) / self.span
+        self.index = None
+        self.sorter = None
+        self.version = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_bikes(cls, bikes, attributes):
+        """Builds the matrix from a {bike_id: {attribute: value}} dict"""
+        attributes = list(attributes)
+        return cls(
+            list(bikes.keys()),
+            attributes,
+            [[bike[attr] for attr in attributes] for bike in bikes.values()],
+        )
+
+    def columns(self, attributes):
+        return [self.attributes.index(attr) for attr in attributes]
+
+    def normalize(self, preference):
+        """Returns the preference columns and their normalized values"""
+        columns = self.columns(preference)
+        return columns, [
+            (preference[attr] - self.min[column]) / self.span[column]
+            for attr, column in zip(preference, columns)]
+
+    def distances(self, preference):
+        """Returns the L1 distance of every row to the normalized preference,
+        summed in the preference attribute order.
+        """
+        return l1_distances(self.normalized, *self.normalize(preference))
+
+    def mask(self, ids):
+        """Returns a boolean mask of the rows holding any of the given ids"""
+        ids = np.asarray(ids, dtype=np.int64)
+        mask = np.zeros(len(self.ids), dtype=bool)
+        if not len(self.ids) or not len(ids):
+            return mask
+        if self.sorter is None:
+            self.sorter = np.argsort(self.ids, kind='stable')
+        positions = np.searchsorted(self.ids, ids, sorter=self.sorter)
+        found = positions < len(self.ids)
+        rows = self.sorter[positions[found]]
+        mask[rows[self.ids[rows] == ids[found]]] = True
+        return mask
+
+    def get_index(self):
+        if self.index is None:
+            self.index = KDTree(self.normalized)
+        return self.index
+
+    @staticmethod
+    def matching(distance):
+        """Rescales the distances to the 0-100 matching range"""
+        if not len(distance):
+            return distance
+        min_distance = distance.min()
+        div = distance.max() - min_distance
+        if div == 0:
+            div = 1
+        return ((distance - min_distance) / div) * 100
+
+    @staticmethod
+    def top(scores, k=None):
+        """Returns the indices of the k highest scores ordered like a stable
+        descending sort, selecting them with a partition instead of sorting
+        every score.
+        """
+        if k is None or k >= len(scores):
+            return np.argsort(-scores, kind='stable')
+        if k <= 0:
+            return np.array([], dtype=np.int64)
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+        candidates = np.sort(np.concatenate([above, ties]))
+        return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    def rank(self, preference, limit=None, offset=0, use_index=False,
+            exclude=None):
+        """Returns the (bike_id, matching) pairs sorted by matching.
+        :param limit: Only return this many pairs
+        :param offset: Skip the first offset pairs of the ranking
+        :param use_index: Answer limited queries with the KDTree instead of
+            scoring every row, the result is the same
+        :param exclude: Ids masked out before ranking, they still count for
+            the matching rescale
+        """
+        excluded = None
+        if exclude is not None and len(exclude):
+            excluded = self.mask(exclude)
+        if use_index and limit is not None and len(self.ids):
+            return self._rank_index(
+                preference, offset + limit, excluded)[offset:]
+        matching = self.matching(self.distances(preference))
+        k = None if limit is None else offset + limit
+        if excluded is None:
+            order = self.top(matching, k)
+        else:
+            candidates = np.flatnonzero(~excluded)
+            order = candidates[self.top(matching[candidates], k)]
+        order = order[offset:]
+        return list(zip(self.ids[order].tolist(), matching[order].tolist()))
+
+    def rank_many(self, preferences, limit=None, chunk_size=2 ** 22):
+        """Ranks several preferences at once, scoring each chunk of them as a
+        single (n_preferences, n_bikes) distance matrix. Every result is the
+        same as rank(preference, limit).
+        :param chunk_size: Maximum distance matrix cells held at once
+        """
+        results = []
+        step = max(1, chunk_size // max(1, len(self.ids)))
+        for start in range(0, len(preferences), step):
+            chunk = preferences[start:start + step]
+            width = max(len(preference) for preference in chunk)
+            # Each row sums its own columns in its own order, the padding
+            # has a zero weight
+            columns = np.zeros((len(chunk), width), dtype=np.int64)
+            values = np.zeros((len(chunk), width))
+            weights = np.zeros((len(chunk), width))
+            for row, preference in enumerate(chunk):
+                preference_columns, preference_values = self.normalize(
+                    preference)
+                columns[row, :len(preference)] = preference_columns
+                values[row, :len(preference)] = preference_values
+                weights[row, :len(preference)] = 1
+            distance = np.zeros((len(chunk), len(self.ids)))
+            for step_column in range(width):
+                distance += weights[:, step_column, None] * np.abs(
+                    self.normalized[:, columns[:, step_column]].T -
+                    values[:, step_column, None])
+            for row in distance:
+                matching = self.matching(row)
+                order = self.top(matching, limit)
+                results.append(list(zip(
+                    self.ids[order].tolist(), matching[order].tolist())))
+        return results
+
+    def _rank_index(self, preference, k, excluded=None):
+        # The best matching rows are the farthest ones, the nearest row is
+        # only needed to rescale the distances like matching() does.
+        index = self.get_index()
+        columns, values = self.normalize(preference)
+        _, nearest = index.query(columns, values, 1)
+        min_distance = nearest[0]
+        # At most every excluded row can be among the farthest ones
+        skipped = int(excluded.sum()) if excluded is not None else 0
+        count = max(k, 1) + skipped
+        while True:
+            rows, distance = index.query(columns, values, count,
+                farthest=True)
+            div = distance[0] - min_distance
+            if div == 0:
+                div = 1
+            matching = ((distance - min_distance) / div) * 100
+            if excluded is not None:
+                keep = ~excluded[rows]
+                rows, matching = rows[keep], matching[keep]
+            # Distances one ulp apart can round to the same matching, fetch
+            # rows until every one tied with the k-th is in
+            if count >= len(self.ids) or (len(matching) > max(k, 1) and
+                    matching[-1] < matching[max(k, 1) - 1]):
+                break
+            count *= 2
+        order = np.lexsort((rows, -matching))[:k]
+        return list(zip(
+            self.ids[rows[order]].tolist(), matching[order].tolist()))
+
+
+def l1_distances(points, columns, values):
+    """Sums |points[:, column] - value| column by column, so every engine
+    gets bit-identical distances.
+    """
+    distance = np.zeros(len(points))
+    for column, value in zip(columns, values):
+        distance += np.abs(points[:, column] - value)
+    return distance
+
+
+class KDTree:
+    """Exact k-d tree over the normalized feature space. Queries may use any
+    subset of the columns and answer the k nearest or k farthest rows under
+    the L1 metric, ties broken by row like a stable sort.
+    :param points: The (n, d) normalized matrix
+    :param leaf_size: Maximum rows scored together in a leaf
+    """
+
+    def __init__(self, points, leaf_size=64):
+        self.points = points
+        self.rows = np.arange(len(points))
+        self.start = []
+        self.end = []
+        self.children = []
+        self.lo = []
+        self.hi = []
+        if not len(points):
+            return
+        stack = [self._add_node(0, len(points))]
+        while stack:
+            node = stack.pop()
+            start, end = self.start[node], self.end[node]
+            spread = self.hi[node] - self.lo[node]
+            if end - start <= leaf_size or not spread.any():
+                continue
+            dimension = np.argmax(spread)
+            middle = (start + end) // 2
+            segment = self.rows[start:end]
+            self.rows[start:end] = segment[np.argpartition(
+                points[segment, dimension], middle - start)]
+            self.children[node] = (
+                self._add_node(start, middle), self._add_node(middle, end))
+            stack.extend(self.children[node])
+        # A query only bounds the few nodes it reaches, plain floats are
+        # cheaper to read one at a time than array elements
+        self.lo = [lo.tolist() for lo in self.lo]
+        self.hi = [hi.tolist() for hi in self.hi]
+
+    def _add_node(self, start, end):
+        points = self.points[self.rows[start:end]]
+        self.start.append(start)
+        self.end.append(end)
+        self.children.append(None)
+        self.lo.append(points.min(axis=0))
+        self.hi.append(points.max(axis=0))
+        return len(self.start) - 1
+
+    def _bound(self, node, columns, values, farthest):
+        # Distance bound of the node box, computed when the node is reached
+        lo, hi = columns(self.lo[node]), columns(self.hi[node])
+        if farthest:
+            return sum(map(max, map(abs, map(sub, values, lo)),
+                           map(abs, map(sub, values, hi))))
+        return sum(map(max, map(sub, lo, values), map(sub, values, hi),
+                       repeat(0)))
+
+    def query(self, columns, values, k, farthest=False):
+        """Returns the rows and distances of the k nearest (or farthest)
+        points, best first.
+        """
+        rows = np.array([], dtype=np.int64)
+        distance = np.array([])
+        if not self.start or k <= 0:
+            return rows, distance
+        sign = -1 if farthest else 1
+        values = np.asarray(values, dtype=np.float64)
+        # Reads the query columns of a node box as a tuple
+        box_columns = itemgetter(*columns) if len(columns) > 1 else \
+            lambda box: (box[columns[0]],)
+        box_values = values.tolist()
+        heap = [(sign * self._bound(0, box_columns, box_values, farthest), 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if len(rows) == k:
+                worst = sign * distance[-1]
+                # Keep nodes that could still tie with the worst row
+                if bound > worst + 1e-9 * max(1, abs(worst)):
+                    break
+            if self.children[node] is not None:
+                for child in self.children[node]:
+                    heapq.heappush(heap, (
+                        sign * self._bound(
+                            child, box_columns, box_values, farthest),
+                        child))
+                continue
+            leaf = self.rows[self.start[node]:self.end[node]]
+            rows = np.concatenate([rows, leaf])
+            distance = np.concatenate([distance, l1_distances(
+                self.points[leaf], columns, values)])
+            best = np.lexsort((rows, sign * distance))[:k]
+            rows, distance = rows[best], distance[best]
+        return rows, distance
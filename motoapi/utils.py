@@ -2,16 +2,23 @@ import random
 import string
 import datetime
 import re
+import json
+import base64
 import requests
+import jwt as pyjwt
 from functools import wraps, lru_cache
 
-from flask import request, jsonify
-from flask_jwt_extended import get_jwt_identity, decode_token
+from flask import request, jsonify, g
+from flask_jwt_extended import (get_jwt_identity, create_access_token,
+    create_refresh_token)
 from flask_jwt_extended.exceptions import NoAuthorizationError
 from flask_restful import reqparse
+from sqlalchemy import inspect, tuple_
+from sqlalchemy.orm import joinedload
 
 from motoapi import motoapi, db, jwt, babel
-from motoapi.models import User, TokenBlacklist, Role
+from motoapi.models import User, TokenBlacklist, CacheGeneration
+from motoapi.revocation import revocation_cache
 from motoapi.fields import user_fields, integer
 from motoapi.exceptions import TokenNotFound
 from config import Config
@@ -28,21 +35,29 @@ def get_random_integer(length):
 
 
 def current_user():
-    user = User.query.filter_by(id=get_jwt_identity()).first()
-    if not user:
-        raise Exception('Unknown user check that the auth token is correct.')
-    return user
+    """Returns the user of the request's token. It is loaded once per
+    request, with its roles, and kept on flask.g.
+    """
+    if 'current_user' not in g:
+        user = User.query.options(joinedload(User.roles)).filter_by(
+            id=get_jwt_identity()).first()
+        if not user:
+            raise Exception(
+                'Unknown user check that the auth token is correct.')
+        g.current_user = user
+    return g.current_user
+
+
+def role_names(user):
+    return {role.name for role in user.roles}
 
 
 def roles_required(*roles):
     def decorator(function):
         @wraps(function)
         def wrapper(*args, **kwargs):
-            user = current_user()
-            for role_name in roles:
-                role = Role.query.filter_by(name=role_name).first()
-                if not role or role not in user.roles:
-                    raise NoAuthorizationError
+            if not set(roles) <= role_names(current_user()):
+                raise NoAuthorizationError
             return function(*args, **kwargs)
         return wrapper
     return decorator
@@ -52,16 +67,20 @@ def roles_accepted(*roles):
     def decorator(function):
         @wraps(function)
         def wrapper(*args, **kwargs):
-            user = current_user()
-            for role_name in roles:
-                role = Role.query.filter_by(name=role_name).first()
-                if role and role in user.roles:
-                    return function(*args, **kwargs)
+            if set(roles) & role_names(current_user()):
+                return function(*args, **kwargs)
             raise NoAuthorizationError
         return wrapper
     return decorator
 
 
+@motoapi.before_request
+def before_request():
+    # The app context, and so g, outlives the request when it was pushed
+    # beforehand, like the tests do
+    g.pop('current_user', None)
+
+
 @motoapi.after_request
 def after_request(response):
     try:
@@ -69,9 +88,6 @@ def after_request(response):
     except Exception:
         pass
 
-    # https://stackoverflow.com/questions/30241911/psycopg2-error-databaseerror-error-with-no-message-from-the-libpq
-    db.engine.dispose()
-
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers',
         'Content-Type,Authorization')
@@ -117,21 +133,53 @@ def valid_username(username):
     return True
 
 
+def token_row(encoded_token, identity_claim):
+    """Builds the TokenBlacklist row of a token this app just signed. The
+    claims are read without verifying the signature, decode_token would
+    check what we have just written.
+    """
+    claims = pyjwt.decode(encoded_token, verify=False)
+    return {
+        'jti': claims['jti'],
+        'token_type': claims['type'],
+        'user_identity': claims[identity_claim],
+        'expires': datetime.datetime.fromtimestamp(claims['exp']),
+        'revoked': False,
+    }
+
+
+def add_tokens_to_database(encoded_tokens, identity_claim):
+    """
+    Adds the new tokens to the database in one insert and commit. They are
+    not revoked when they are added.
+    :param identity_claim:
+    """
+    db.session.execute(TokenBlacklist.__table__.insert(), [
+        token_row(encoded_token, identity_claim)
+        for encoded_token in encoded_tokens])
+    db.session.commit()
+
+
 def add_token_to_database(encoded_token, identity_claim):
     """
     Adds a new token to the database. It is not revoked when it is added.
     :param identity_claim:
     """
-    decoded_token = decode_token(encoded_token)
-    db_token = TokenBlacklist(
-        jti=decoded_token['jti'],
-        token_type=decoded_token['type'],
-        user_identity=decoded_token[identity_claim],
-        expires=datetime.datetime.fromtimestamp(decoded_token['exp']),
-        revoked=False,
-    )
-    db.session.add(db_token)
-    db.session.commit()
+    add_tokens_to_database([encoded_token], identity_claim)
+
+
+def issue_tokens(identity, refresh=True):
+    """Creates an access token, and a refresh token unless refresh is False,
+    and stores them in a single transaction. The user reads from the
+    primary for a while, the replica may not have them or their tokens yet.
+    Returns the list of encoded tokens, access token first.
+    """
+    tokens = [create_access_token(identity=identity)]
+    if refresh:
+        tokens.append(create_refresh_token(identity=identity))
+    add_tokens_to_database(tokens, motoapi.config['JWT_IDENTITY_CLAIM'])
+    db.pin_to_primary(identity)
+    return tokens
 
 
 def is_token_revoked(decoded_token):
@@ -139,11 +187,9 @@ def is_token_revoked(decoded_token):
     Checks if the given token is revoked or not. Because we are adding all the
     tokens that we create into this database, if the token is not present
     in the database we are going to consider it revoked, as we don't know where
-    it was created.
+    it was created. The answer is cached, see RevocationCache.
     """
-    jti = decoded_token['jti']
-    token = TokenBlacklist.query.filter_by(jti=jti).first()
-    return token.revoked if token else True
+    return revocation_cache.is_revoked(decoded_token)
 
 
 def get_user_tokens(user_identity):
@@ -164,7 +210,9 @@ def revoke_token(token_id, user):
     if not token:
         raise TokenNotFound("Could not find the token {}".format(token_id))
     token.revoked = True
+    CacheGeneration.bump('revocation')
     db.session.commit()
+    revocation_cache.invalidate(token.jti)
 
 
 def unrevoke_token(token_id, user):
@@ -177,7 +225,9 @@ def unrevoke_token(token_id, user):
     if not token:
         raise TokenNotFound("Could not find the token {}".format(token_id))
     token.revoked = False
+    CacheGeneration.bump('revocation')
     db.session.commit()
+    revocation_cache.invalidate(token.jti)
 
 
 @jwt.token_in_blacklist_loader
@@ -196,6 +246,8 @@ def abort(code, json=False, *args, **kwargs):
 paging_parser = reqparse.RequestParser()
 paging_parser.add_argument('page', type=integer(allow_negative=False))
 paging_parser.add_argument('page_size', type=integer(allow_negative=False))
+# Opaque keyset cursor, an empty one requests the first page
+paging_parser.add_argument('cursor', type=str)
 
 
 def query_with_paging(query):
@@ -205,3 +257,70 @@ def query_with_paging(query):
         if paging_args.page:
             query = query.offset(paging_args.page * paging_args.page_size)
     return query
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(
+        json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor, types):
+    """Returns the key values of the cursor.
+    :param types: The Python type of each key column, a value of another
+        type would compare with the key differently on every database
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError('Invalid cursor')
+    for value, type_ in zip(values, types):
+        # JSON has no float type of its own, 2.0 is encoded as 2
+        accepted = (int, float) if type_ is float else type_
+        if isinstance(value, bool) or not isinstance(value, accepted):
+            raise ValueError('Invalid cursor')
+    return values
+
+
+def query_with_cursor(query, cursor, page_size, keys=None):
+    """Returns a page of rows ordered by keys and the cursor of the next one,
+    None on the last page. Each page seeks straight past the previous one
+    instead of counting OFFSET rows.
+    :param cursor: The cursor returned with the previous page, empty for
+        the first one
+    :param keys: Model attributes forming a unique sort key, the primary key
+        of the queried model by default
+    """
+    if keys is None:
+        entity = query.column_descriptions[0]['entity']
+        keys = [getattr(entity, column.key)
+                for column in inspect(entity).primary_key]
+    if cursor:
+        query = query.filter(tuple_(*keys) > tuple_(*decode_cursor(cursor,
+            [key.type.python_type for key in keys])))
+    rows = query.order_by(*keys).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor([getattr(rows[-1], key.key) for key in keys])
+
+
+def paged_response(query, fields, keys=None):
+    """Serializes a list with the page/page_size paging or, when a cursor is
+    given, as {'items': [...], 'next_cursor': ...}.
+    :param fields: The serializer of each row
+    :param keys: The cursor sort key, see query_with_cursor
+    """
+    paging_args = paging_parser.parse_args()
+    if paging_args.cursor is None:
+        return [fields(row) for row in query_with_paging(query)]
+    try:
+        rows, next_cursor = query_with_cursor(query, paging_args.cursor,
+            paging_args.page_size or motoapi.config['CURSOR_PAGE_SIZE'], keys)
+    except ValueError as e:
+        return abort(400, message=str(e))
+    return {
+        'items': [fields(row) for row in rows],
+        'next_cursor': next_cursor,
+    }
@@ -34,12 +34,16 @@ setup(
         'python-magic',
         'lorem',
         'passlib',
+        'numpy',
         'itsdangerous==2.0',
         'jinja2==3.0.3',
         'Werkzeug==2.0.3',
         'Flask-jwt-extended==3.25.0',
         'jwt',
     ],
+    extras_require={
+        'gevent': ['gevent'],
+    },
     long_description=read('README.md'),
     classifiers=[
         "Development Status :: 3 - Alpha",
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from motoapi import motoapi, db
+from motoapi.models import Brand, Variation, User, Role
+from motoapi.utils import add_token_to_database
+from motoapi.catalog import (catalog_cache, cold_start_pool,
+    recommendation_cache)
+from motoapi.revocation import revocation_cache
+
+TEST_DB = os.path.join(tempfile.gettempdir(), 'motoapi-test.db')
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs every test against a freshly created sqlite database"""
+
+    @classmethod
+    def setUpClass(cls):
+        motoapi.config['TESTING'] = True
+        motoapi.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + TEST_DB
+        cls.motoapi = motoapi
+        cls.client = motoapi.test_client()
+        super().setUpClass()
+
+    def setUp(self):
+        self.context = motoapi.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        catalog_cache.clear()
+        cold_start_pool.clear()
+        recommendation_cache.clear()
+        revocation_cache.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def add_variation(self, name, brand=None, **kwargs):
+        if brand is None:
+            brand = Brand.query.filter_by(name='Honda').first() or Brand(
+                name='Honda')
+        kwargs.setdefault('fetch_state', 'success')
+        kwargs.setdefault('price', 0)
+        variation = Variation(name=name, brand=brand, **kwargs)
+        db.session.add(variation)
+        db.session.commit()
+        return variation
+
+    def add_catalog(self, count, prefix='CB', own_brands=False):
+        """Adds count variations with every feature filled in, ids and specs
+        increasing together.
+        :param own_brands: Give each variation its own brand
+        """
+        return [
+            self.add_variation('%s%s' % (prefix, i),
+                brand=Brand(name='Brand%s' % i) if own_brands else None,
+                model_year=2000 + i, displacement=600.0 + 10 * i,
+                top_speed=200.0, power=50.0 + i, fuel_capacity=14.0,
+                weight=190.0 + i, valves_per_cylinder=4, category=i % 8)
+            for i in range(count)]
+
+    def add_user(self, username='rider'):
+        user = User(username=username, name=username,
+            email='%s@motoapi.com' % username, password='')
+        db.session.add(user)
+        db.session.commit()
+        access_token = create_access_token(identity=user.id)
+        add_token_to_database(access_token,
+            motoapi.config['JWT_IDENTITY_CLAIM'])
+        return user, {'Authorization': 'Bearer %s' % access_token}
+
+    def add_admin(self, username='admin'):
+        user, headers = self.add_user(username)
+        user.roles.append(Role.query.filter_by(name='admin').first() or
+            Role(name='admin'))
+        db.session.commit()
+        return user, headers
+
+    @contextmanager
+    def record_queries(self):
+        """Collects the (statement, parameters) of every query executed"""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, many):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
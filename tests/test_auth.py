@@ -0,0 +1,51 @@
+from flask_jwt_extended import decode_token
+
+from motoapi import db
+from motoapi.models import TokenBlacklist, User
+
+from tests.base import DatabaseTestCase
+
+
+class TokenIssuanceTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='rider', name='rider',
+            email='rider@motoapi.com', password=User.generate_hash('password'))
+        db.session.add(self.user)
+        db.session.commit()
+
+    def login(self):
+        response = self.client.post('/api/auth/login',
+            data={'username': 'rider', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.json
+
+    def assertStored(self, encoded_token):
+        claims = decode_token(encoded_token)
+        token = TokenBlacklist.query.filter_by(jti=claims['jti']).one()
+        self.assertEqual(token.token_type, claims['type'])
+        self.assertEqual(token.user_identity, str(self.user.id))
+        self.assertEqual(token.expires.timestamp(), claims['exp'])
+        self.assertFalse(token.revoked)
+
+    def test_login_stores_both_tokens_at_once(self):
+        with self.record_queries() as statements:
+            response = self.login()
+        inserts = [(statement, parameters) for statement, parameters
+                   in statements if statement.startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertIn('token_blacklist', inserts[0][0])
+        self.assertEqual(len(inserts[0][1]), 2)
+        self.assertStored(response['access_token'])
+        self.assertStored(response['refresh_token'])
+
+    def test_refresh(self):
+        refresh_token = self.login()['refresh_token']
+        response = self.client.post('/api/auth/refresh',
+            headers={'Authorization': 'Bearer %s' % refresh_token})
+        self.assertEqual(response.status_code, 201)
+        self.assertStored(response.json['access_token'])
+        self.assertEqual(self.client.get('/api/user/me', headers={
+            'Authorization': 'Bearer %s' % response.json['access_token']}
+            ).status_code, 200)
@@ -0,0 +1,84 @@
+import unittest
+
+from motoapi import db
+from motoapi.cache import LRUCache
+from motoapi.catalog import catalog_cache, recommendation_cache
+from motoapi.models import CacheGeneration
+
+from tests.base import DatabaseTestCase
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']),
+            (3, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.75)
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=10, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=0)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(len(cache), 1)
+
+
+class RecommendationCacheTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.interval = self.motoapi.config['CATALOG_VERSION_INTERVAL']
+        for i in range(5):
+            self.add_variation('R%s' % i, model_year=2000 + i,
+                displacement=300.0 + i, top_speed=160.0, power=30.0,
+                fuel_capacity=13.0, weight=160.0, valves_per_cylinder=4,
+                category=6)
+
+    def tearDown(self):
+        self.motoapi.config['CATALOG_VERSION_INTERVAL'] = self.interval
+        self.motoapi.config['RECOMMENDATION_CACHE_QUANTUM'] = 0
+        super().tearDown()
+
+    def get(self, query):
+        response = self.client.get('/api/variant/recommendation?' + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json
+
+    def test_repeated_queries_hit(self):
+        first = self.get('power=30&model_year=2001')
+        self.assertEqual(self.get('model_year=2001&power=30'), first)
+        self.assertNotEqual(self.get('model_year=2002&power=30'), first)
+        _, headers = self.add_admin()
+        stats = self.client.get('/api/variant/recommendation/stats',
+            headers=headers).json
+        self.assertEqual(stats['results']['hits'], 1)
+        self.assertEqual(stats['results']['size'], 2)
+        self.assertEqual(stats['catalog']['rows'], 5)
+
+    def test_quantized_queries_share_entries(self):
+        self.motoapi.config['RECOMMENDATION_CACHE_QUANTUM'] = 10
+        self.get('displacement=301')
+        self.get('displacement=304')
+        self.get('displacement=296')
+        self.assertEqual(recommendation_cache.stats()['hits'], 2)
+
+    def test_generation_bump_invalidates(self):
+        self.motoapi.config['CATALOG_VERSION_INTERVAL'] = 0
+        self.get('model_year=2001')
+        version = catalog_cache.version
+        CacheGeneration.bump('recommendation')
+        db.session.commit()
+        self.get('model_year=2001')
+        self.assertNotEqual(catalog_cache.version, version)
+        self.assertEqual(recommendation_cache.stats()['hits'], 0)
@@ -0,0 +1,79 @@
+from unittest import mock
+
+from motoapi import db
+from motoapi.catalog import catalog_cache
+from motoapi.scoring import KDTree
+
+from tests.base import DatabaseTestCase
+
+
+class CatalogCacheTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.interval = self.motoapi.config['CATALOG_VERSION_INTERVAL']
+        self.variation = self.add_variation('Z900', model_year=2020,
+            displacement=948.0, top_speed=240.0, power=92.2,
+            fuel_capacity=17.0, weight=210.0, valves_per_cylinder=4,
+            category=5)
+
+    def tearDown(self):
+        self.motoapi.config['CATALOG_VERSION_INTERVAL'] = self.interval
+        super().tearDown()
+
+    def test_cache_hits_until_probe(self):
+        matrix = catalog_cache.get()
+        self.assertEqual(matrix.ids.tolist(), [self.variation.id])
+        self.add_variation('Z650', model_year=2020, displacement=649.0,
+            top_speed=200.0, power=50.2, fuel_capacity=15.0, weight=187.0,
+            valves_per_cylinder=4, category=5)
+        # Still inside the probe interval
+        self.assertIs(catalog_cache.get(), matrix)
+        self.assertEqual(catalog_cache.stats()['hits'], 1)
+        self.assertEqual(catalog_cache.stats()['misses'], 1)
+
+    def test_version_change_rebuilds(self):
+        self.motoapi.config['CATALOG_VERSION_INTERVAL'] = 0
+        matrix = catalog_cache.get()
+        self.assertIs(catalog_cache.get(), matrix)
+        self.variation.power = 100.0
+        db.session.commit()
+        matrix = catalog_cache.get()
+        self.assertEqual(matrix.values[0].tolist()[3], 100.0)
+        stats = catalog_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertEqual(stats['rows'], 1)
+        self.assertGreater(stats['build_time'], 0)
+
+    def test_swinger_uses_the_cache(self):
+        user, headers = self.add_user()
+        response = self.client.post('/api/variant/swinger', headers=headers,
+            data={'variant': self.variation.id, 'liked': 1})
+        self.assertEqual(response.status_code, 200)
+        hits = catalog_cache.stats()['hits']
+        with self.record_queries() as statements:
+            response = self.client.get('/api/variant/swinger',
+                headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(catalog_cache.stats()['hits'], hits + 1)
+        self.assertEqual(catalog_cache.stats()['misses'], 1)
+        # Only the catalog version probe reads every feature column
+        self.assertEqual([statement for statement, _ in statements
+                          if 'valves_per_cylinder IS NOT NULL' in statement],
+                         [])
+
+    def test_kdtree_swinger_builds_one_tree(self):
+        user, headers = self.add_user()
+        self.client.post('/api/variant/swinger', headers=headers,
+            data={'variant': self.variation.id, 'liked': 1})
+        engine = self.motoapi.config['RECOMMENDATION_ENGINE']
+        self.motoapi.config['RECOMMENDATION_ENGINE'] = 'kdtree'
+        try:
+            with mock.patch('motoapi.scoring.KDTree', wraps=KDTree) as tree:
+                for _ in range(3):
+                    self.assertEqual(self.client.get('/api/variant/swinger',
+                        headers=headers).status_code, 200)
+        finally:
+            self.motoapi.config['RECOMMENDATION_ENGINE'] = engine
+        self.assertEqual(tree.call_count, 1)
+        self.assertIsNotNone(catalog_cache.get().index)
@@ -0,0 +1,62 @@
+from flask_jwt_extended import verify_jwt_in_request
+from flask_jwt_extended.exceptions import NoAuthorizationError
+
+from motoapi import motoapi, db
+from motoapi.models import Role
+from motoapi.utils import current_user, roles_required, roles_accepted
+
+from tests.base import DatabaseTestCase
+
+
+class CurrentUserTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.interval = motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL']
+        motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL'] = 60
+        self.user, self.headers = self.add_user()
+        self.user.roles = [Role(name='admin'), Role(name='editor')]
+        db.session.add(Role(name='viewer'))
+        db.session.commit()
+
+    def tearDown(self):
+        motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL'] = self.interval
+        super().tearDown()
+
+    def test_me_loads_the_user_once(self):
+        self.client.get('/api/user/me', headers=self.headers)
+        db.session.expire_all()
+        with self.record_queries() as statements:
+            response = self.client.get('/api/user/me', headers=self.headers)
+        self.assertEqual(response.json['id'], self.user.id)
+        self.assertEqual(len(statements), 1)
+
+    def test_every_request_gets_its_own_user(self):
+        other, headers = self.add_user('other')
+        self.assertEqual(self.client.get('/api/user/me',
+            headers=self.headers).json['id'], self.user.id)
+        self.assertEqual(self.client.get('/api/user/me',
+            headers=headers).json['id'], other.id)
+
+    def test_role_checks_run_no_extra_queries(self):
+        @roles_required('admin', 'editor')
+        @roles_accepted('viewer', 'admin')
+        def allowed():
+            return current_user()
+
+        @roles_required('admin', 'viewer')
+        def required():
+            pass
+
+        @roles_accepted('viewer', 'unknown')
+        def accepted():
+            pass
+
+        db.session.expire_all()
+        with motoapi.test_request_context(headers=self.headers):
+            verify_jwt_in_request()
+            with self.record_queries() as statements:
+                self.assertEqual(allowed().id, self.user.id)
+                self.assertRaises(NoAuthorizationError, required)
+                self.assertRaises(NoAuthorizationError, accepted)
+        self.assertEqual(len(statements), 1)
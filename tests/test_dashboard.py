@@ -0,0 +1,123 @@
+from unittest import mock
+
+from flask_sqlalchemy import BaseQuery
+
+from motoapi import db
+from motoapi.models import (LikedVariant, DislikedVariant, Variation,
+    VariantStats, CategoryStats)
+
+from tests.base import DatabaseTestCase
+
+
+class DashBoardTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.variations = [
+            self.add_variation('DB%s' % i, category=i % 3)
+            for i in range(4)]
+        self.variations.append(self.add_variation('DBnone'))
+        self.users = [self.add_user('rider%s' % i)[0] for i in range(3)]
+
+    def swipe(self, Swipe, user, *variations):
+        db.session.add_all([Swipe(user=self.users[user], variant=variation)
+            for variation in variations])
+        VariantStats.rebuild()
+        db.session.commit()
+
+    def test_empty(self):
+        response = self.client.get('/api/variant/dash')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['num_likes'], 0)
+        self.assertIsNone(response.json['most_liked'])
+        self.assertEqual(set(response.json['like_categories'].values()), {0})
+
+    def test_stats(self):
+        first, second, third, fourth, uncategorized = self.variations
+        self.swipe(LikedVariant, 0, first, second, fourth, uncategorized)
+        self.swipe(LikedVariant, 1, second, fourth)
+        self.swipe(LikedVariant, 2, fourth)
+        self.swipe(DislikedVariant, 0, third)
+        self.swipe(DislikedVariant, 1, first, third)
+        with self.record_queries() as statements:
+            response = self.client.get('/api/variant/dash').json
+        self.assertEqual(len(statements), 4)
+
+        self.assertEqual(response['num_likes'], 7)
+        self.assertEqual(response['num_dislikes'], 3)
+        self.assertEqual(response['most_liked']['id'], fourth.id)
+        self.assertEqual(response['most_liked']['likes'], 3)
+        self.assertEqual(response['most_disliked']['id'], third.id)
+        self.assertEqual(response['most_disliked']['dislikes'], 2)
+        categories = Variation.CATEGORIES
+        self.assertEqual(response['like_categories'][categories[0]], 4)
+        self.assertEqual(response['like_categories'][categories[1]], 2)
+        self.assertEqual(response['like_categories'][categories[2]], 0)
+        self.assertEqual(response['dislike_categories'][categories[0]], 1)
+        self.assertEqual(response['dislike_categories'][categories[2]], 2)
+        self.assertEqual(set(response['like_categories']), set(categories))
+
+    def test_ties_pick_the_lowest_id(self):
+        self.swipe(LikedVariant, 0, self.variations[2], self.variations[1])
+        response = self.client.get('/api/variant/dash').json
+        self.assertEqual(response['most_liked']['id'], self.variations[1].id)
+
+    def test_swipes_update_counters(self):
+        first, second, third, fourth, uncategorized = self.variations
+        headers = [self.add_user('swiper%s' % i)[1] for i in range(2)]
+        for user, variation, liked in [(0, first, 1), (0, first, 1),
+                (1, first, 1), (0, uncategorized, 1), (1, second, 0),
+                (1, first, 0)]:
+            response = self.client.post('/api/variant/swinger',
+                headers=headers[user], data={'variant': variation.id,
+                    'liked': liked, 'disliked': not liked})
+            self.assertEqual(response.status_code, 200)
+
+        def counters():
+            return (
+                sorted((s.variant_id, s.likes, s.dislikes)
+                       for s in VariantStats.query),
+                sorted((s.category, s.likes, s.dislikes)
+                       for s in CategoryStats.query))
+
+        swiped = counters()
+        self.assertEqual(swiped[0], [
+            (first.id, 2, 1), (second.id, 0, 1), (uncategorized.id, 1, 0)])
+        self.assertEqual(swiped[1], [
+            (CategoryStats.UNCATEGORIZED, 1, 0), (0, 2, 1), (1, 0, 1)])
+        self.assertIsNotNone(VariantStats.query.get(first.id).last_swiped_at)
+        VariantStats.rebuild()
+        db.session.commit()
+        self.assertEqual(counters(), swiped)
+        self.assertIsNotNone(VariantStats.query.get(first.id).last_swiped_at)
+
+    def test_concurrent_first_swipes(self):
+        first = self.variations[0]
+        _, headers = self.add_user('swiper')
+        # Another worker inserts the counters between the UPDATE that found
+        # no row and the INSERT of this one
+        db.session.execute(VariantStats.__table__.insert().values(
+            variant_id=first.id, likes=1, dislikes=0))
+        db.session.execute(CategoryStats.__table__.insert().values(
+            category=first.category, likes=1, dislikes=0))
+        db.session.commit()
+        update = BaseQuery.update
+
+        missed = set()
+
+        def missing_update(query, *args, **kwargs):
+            model = query.column_descriptions[0]['type']
+            if model in (VariantStats, CategoryStats) and model not in missed:
+                missed.add(model)
+                return 0
+            return update(query, *args, **kwargs)
+
+        with mock.patch.object(BaseQuery, 'update', missing_update):
+            response = self.client.post('/api/variant/swinger',
+                headers=headers, data={'variant': first.id, 'liked': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(LikedVariant.query.count(), 1)
+        self.assertEqual([(s.likes, s.dislikes) for s in VariantStats.query],
+            [(2, 0)])
+        self.assertEqual([(s.likes, s.dislikes) for s in CategoryStats.query],
+            [(2, 0)])
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+from motoapi import motoapi, db
+from motoapi.database import MeteredQueuePool, make_fork_safe, pool_stats
+
+from tests.base import DatabaseTestCase
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pool_stats.reset()
+        self.engine = create_engine(
+            'sqlite:///' + os.path.join(tempfile.gettempdir(),
+                'motoapi-pool.db'),
+            poolclass=MeteredQueuePool, pool_size=2, max_overflow=1)
+        make_fork_safe(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_options(self):
+        options = db.apply_driver_hacks(motoapi,
+            make_url('postgresql://motoapi@localhost/motoapi'), {})[1]
+        self.assertIs(options['poolclass'], MeteredQueuePool)
+        self.assertEqual(options['pool_size'],
+            motoapi.config['DATABASE_POOL_SIZE'])
+        self.assertEqual(options['max_overflow'],
+            motoapi.config['DATABASE_MAX_OVERFLOW'])
+        self.assertTrue(options['pool_pre_ping'])
+        options = db.apply_driver_hacks(motoapi,
+            make_url('sqlite:///' + os.path.join(tempfile.gettempdir(),
+                'motoapi-pool.db')), {})[1]
+        self.assertNotIn('pool_size', options)
+
+    def test_reuses_connections(self):
+        for _ in range(3):
+            with self.engine.connect() as connection:
+                connection.execute('SELECT 1')
+        self.assertEqual(self.engine.pool.checkedin(), 1)
+        self.assertEqual(pool_stats.checkouts, 3)
+        first = self.engine.connect()
+        second = self.engine.connect()
+        third = self.engine.connect()
+        self.assertEqual(self.engine.pool.checkedout(), 3)
+        self.assertEqual(self.engine.pool.overflow(), 1)
+        for connection in (first, second, third):
+            connection.close()
+
+    def test_discards_connections_of_parent_process(self):
+        with self.engine.connect() as connection:
+            inherited = connection.connection.connection
+        record = self.engine.pool._pool.queue[0]
+        record.info['pid'] = -1
+        with self.engine.connect() as connection:
+            self.assertIsNot(connection.connection.connection, inherited)
+            self.assertEqual(connection.connection._connection_record.info[
+                'pid'], os.getpid())
+
+
+class DatabaseStatsTestCase(DatabaseTestCase):
+
+    def test_stats(self):
+        _, headers = self.add_admin()
+        response = self.client.get('/api/stats/database', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('checkouts', response.json)
+        self.assertIn('max_wait_time', response.json)
+
+    def test_stats_need_an_admin(self):
+        self.assertEqual(
+            self.client.get('/api/stats/database').status_code, 401)
+        _, headers = self.add_user()
+        for url in ['/api/stats/database', '/api/stats/tokens',
+                    '/api/stats/passwords',
+                    '/api/variant/recommendation/stats']:
+            self.assertEqual(
+                self.client.get(url, headers=headers).status_code, 401, url)
+
+
+@unittest.skipIf(gevent is None, 'gevent is not installed')
+class CooperativeTestCase(unittest.TestCase):
+
+    def test_sessions_are_scoped_to_greenlets(self):
+        from flask import Flask
+        from motoapi.database import SQLAlchemy
+
+        app = Flask(__name__)
+        app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://',
+            SQLALCHEMY_TRACK_MODIFICATIONS=False, DATABASE_GEVENT=True)
+        cooperative = SQLAlchemy(app)
+        self.assertTrue(cooperative.cooperative)
+        sessions = [gevent.spawn(cooperative.session) for _ in range(2)]
+        gevent.joinall(sessions)
+        self.assertIsNot(sessions[0].value, sessions[1].value)
+
+    def test_wait_callback(self):
+        from psycopg2 import extensions, OperationalError
+        from motoapi.database import gevent_wait_callback
+
+        class Connection:
+            def __init__(self, states):
+                self.states = list(states)
+
+            def poll(self):
+                return self.states.pop(0)
+
+            def fileno(self):
+                return reader
+
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        self.addCleanup(os.close, writer)
+        os.write(writer, b'x')
+        connection = Connection([extensions.POLL_READ, extensions.POLL_OK])
+        gevent_wait_callback(connection)
+        self.assertEqual(connection.states, [])
+        with self.assertRaises(OperationalError):
+            gevent_wait_callback(Connection([-1]))
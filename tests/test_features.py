@@ -0,0 +1,68 @@
+from motoapi import db
+from motoapi.models import Variation, parse_feature
+from motoapi.catalog import load_features
+
+from tests.base import DatabaseTestCase
+
+EXTRA_DATA = {
+    'displacement': '1198.0 ccm (73.10 cubic inches)',
+    'top_speed': '250.0 km/h (155.3 mph)',
+    'power': '131.0 HP (95.6  kW)) @ 9000 RPM',
+    'fuel_capacity': '17.00 litres (4.49 US gallons)',
+    'weight_incl._oil,_gas,_etc': '218.0 kg (480.6 pounds)',
+    'valves_per_cylinder': '4',
+    'category': 'Naked bike',
+}
+
+
+class FeatureColumnsTestCase(DatabaseTestCase):
+
+    def test_parse_feature(self):
+        self.assertEqual(parse_feature('displacement', '649.0 ccm'), 649.0)
+        self.assertEqual(parse_feature('power', '131.0 HP (95.6  kW))'), 95.6)
+        self.assertEqual(parse_feature('power', '47.0 HP'), 47.0)
+        self.assertEqual(parse_feature('valves_per_cylinder', '4'), 4)
+        self.assertEqual(parse_feature('category', 'Sport'), 6)
+        self.assertEqual(parse_feature('category', '3'), 3)
+        with self.assertRaises(ValueError):
+            parse_feature('category', 'Scooter')
+
+    def test_update_features(self):
+        variation = self.add_variation('MT-09', model_year=2020,
+            extra_data=dict(EXTRA_DATA, category='Scooter'))
+        variation.update_features()
+        self.assertEqual(variation.displacement, 1198.0)
+        self.assertEqual(variation.top_speed, 250.0)
+        self.assertEqual(variation.power, 95.6)
+        self.assertEqual(variation.fuel_capacity, 17.0)
+        self.assertEqual(variation.weight, 218.0)
+        self.assertEqual(variation.valves_per_cylinder, 4)
+        self.assertIsNone(variation.category)
+
+    def test_load_features_reads_complete_rows(self):
+        complete = self.add_variation('Tuono', model_year=2021,
+            extra_data=EXTRA_DATA)
+        partial = self.add_variation('Tuono', model_year=2021,
+            extra_data={'displacement': '1077 ccm'})
+        failed = self.add_variation('Tuono', model_year=2021,
+            extra_data=EXTRA_DATA, fetch_state='error')
+        for variation in (complete, partial, failed):
+            variation.update_features()
+        db.session.commit()
+
+        matrix = load_features()
+        self.assertEqual(matrix.ids.tolist(), [complete.id])
+        self.assertEqual(matrix.attributes, Variation.FEATURES)
+        self.assertEqual(matrix.values.tolist(),
+            [[2021, 1198.0, 250.0, 95.6, 17.0, 218.0, 4, 5]])
+
+    def test_recommendation_endpoint(self):
+        for year in (2010, 2015, 2020):
+            self.add_variation('CBR', model_year=year,
+                extra_data=EXTRA_DATA).update_features()
+        db.session.commit()
+        response = self.client.get(
+            '/api/variant/recommendation?model_year=2010&power=95')
+        self.assertEqual(response.status_code, 200)
+        matching = {v['model_year']: v['matching'] for v in response.json}
+        self.assertEqual(matching, {2010: 0.0, 2015: 50.0, 2020: 100.0})
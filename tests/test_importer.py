@@ -0,0 +1,56 @@
+from motoapi.importer import VersionImporter, import_brands, parse_version
+from motoapi.models import Brand, Variation
+
+from tests.base import DatabaseTestCase
+
+
+def version(id, name, brand, year=2019, price=5000.0):
+    return (id, name, None, year, 'Petrol', price, brand)
+
+
+class ImporterTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_variation('CB500F', brand=Brand(name='Honda'))
+        self.brands = import_brands(['Honda', 'Yamaha', 'Yamaha'])
+        self.rows = [
+            version(1, 'MT-07 (2019 - 2020)', 'Yamaha'),
+            version(2, 'CB500F (2019)', 'Honda'),
+            version(3, 'Unknown (2019)', 'Ducati'),
+            version(4, 'No year', 'Honda'),
+            version(5, 'MT-09 (2021)', 'Yamaha', price=9000.0),
+            version(6, 'MT-07 (2021)', 'Yamaha'),
+            version(7, 'CB650R (2021)', 'Honda'),
+        ]
+
+    def test_import_brands(self):
+        self.assertEqual(set(self.brands), {'Honda', 'Yamaha'})
+        self.assertEqual(Brand.query.count(), 2)
+        self.assertEqual(import_brands(['Honda']), self.brands)
+
+    def test_parse_version(self):
+        self.assertEqual(parse_version(self.rows[4], self.brands), {
+            'name': 'MT-09', 'brand_id': self.brands['Yamaha'],
+            'model_year': 2021, 'year': 2019, 'price': 9000.0})
+        self.assertIsNone(parse_version(self.rows[2], self.brands))
+        self.assertIsNone(parse_version(self.rows[3], self.brands))
+
+    def test_run(self):
+        reports = []
+        stats = VersionImporter(self.brands, chunk_size=2,
+            report=reports.append).run(self.rows)
+        self.assertEqual(sorted(v.name for v in Variation.query),
+            ['CB500F', 'CB650R', 'MT-07', 'MT-09'])
+        self.assertEqual((stats['read'], stats['imported'], stats['last_id']),
+            (7, 3, 7))
+        self.assertEqual([report['last_id'] for report in reports],
+            [2, 4, 6, 7])
+
+    def test_resume(self):
+        importer = VersionImporter(self.brands, chunk_size=2)
+        importer.run(self.rows[:4])
+        # Rerunning from the start only imports what is missing
+        stats = VersionImporter(self.brands, chunk_size=2).run(self.rows)
+        self.assertEqual(stats['imported'], 2)
+        self.assertEqual(Variation.query.count(), 4)
@@ -1,7 +1,6 @@
 import unittest
 
 from motoapi import motoapi, db
-from manage import create_user
 
 TEST_DB = 'test.db'
 
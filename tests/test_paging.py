@@ -0,0 +1,60 @@
+from motoapi.utils import encode_cursor, decode_cursor
+
+from tests.base import DatabaseTestCase
+
+
+class CursorPagingTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.variations = [self.add_variation('CP%s' % i) for i in range(7)]
+        self.add_variation('CPerror', fetch_state='error')
+
+    def pages(self, page_size):
+        ids, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get('/api/variant', query_string={
+                'cursor': cursor, 'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.json['items']), page_size)
+            ids.append([item['id'] for item in response.json['items']])
+            cursor = response.json['next_cursor']
+        return ids
+
+    def test_walks_every_page(self):
+        ids = [v.id for v in self.variations]
+        self.assertEqual(self.pages(3), [ids[0:3], ids[3:6], ids[6:7]])
+        self.assertEqual(self.pages(7), [ids])
+
+    def test_rows_added_while_paging(self):
+        response = self.client.get('/api/variant?cursor=&page_size=3')
+        first = [item['id'] for item in response.json['items']]
+        # Unlike OFFSET, a new row doesn't shift the following pages
+        self.add_variation('CPnew')
+        response = self.client.get('/api/variant', query_string={
+            'cursor': response.json['next_cursor'], 'page_size': 3})
+        second = [item['id'] for item in response.json['items']]
+        self.assertEqual(first + second, [v.id for v in self.variations[:6]])
+
+    def test_page_size_compatibility(self):
+        response = self.client.get('/api/variant?page=1&page_size=3')
+        self.assertEqual(len(response.json), 3)
+        self.assertIsInstance(response.json, list)
+
+    def test_invalid_cursor(self):
+        for cursor in ['nope', encode_cursor([1, 2]), encode_cursor('1'),
+                       encode_cursor([[1]]), encode_cursor([{'a': 1}]),
+                       encode_cursor([None]), encode_cursor([True]),
+                       encode_cursor(['abc']), encode_cursor([1.5]),
+                       encode_cursor(['1'])]:
+            response = self.client.get('/api/variant', query_string={
+                'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(
+            decode_cursor(encode_cursor([3, 'CB 500']), [int, str]),
+            [3, 'CB 500'])
+        self.assertEqual(decode_cursor(encode_cursor([2]), [float]), [2])
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor([3, 'CB 500']), [int, int])
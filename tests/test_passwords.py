@@ -0,0 +1,112 @@
+import sys
+import threading
+import time
+import types
+from unittest import mock
+
+from motoapi import motoapi, db
+from motoapi.models import User
+from motoapi.passwords import HashPool, hash_pool, check_cooperative
+
+from tests.base import DatabaseTestCase
+
+
+class PasswordHashTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rounds = motoapi.config['PASSWORD_HASH_ROUNDS']
+        motoapi.config['PASSWORD_HASH_ROUNDS'] = 1000
+        hash_pool.clear()
+        self.user = User(username='rider', name='rider',
+            email='rider@motoapi.com', password=User.generate_hash('password'))
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        motoapi.config['PASSWORD_HASH_ROUNDS'] = self.rounds
+        super().tearDown()
+
+    def login(self, password='password'):
+        return self.client.post('/api/auth/login',
+            data={'username': 'rider', 'password': password})
+
+    def test_rounds(self):
+        self.assertTrue(self.user.password.startswith('$pbkdf2-sha512$1000$'))
+        self.assertTrue(User.verify_hash('password', self.user.password))
+        self.assertFalse(User.verify_hash('other', self.user.password))
+
+    def test_rehash_on_login(self):
+        motoapi.config['PASSWORD_HASH_ROUNDS'] = 1200
+        self.assertEqual(self.login('other').status_code, 400)
+        self.assertTrue(self.user.password.startswith('$pbkdf2-sha512$1000$'))
+        self.assertEqual(self.login().status_code, 200)
+        db.session.expire_all()
+        password = User.query.filter_by(id=self.user.id).one().password
+        self.assertTrue(password.startswith('$pbkdf2-sha512$1200$'))
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(
+            User.query.filter_by(id=self.user.id).one().password, password)
+
+    def test_stats(self):
+        self.login()
+        _, headers = self.add_admin()
+        stats = self.client.get('/api/stats/passwords', headers=headers).json
+        # The hash of setUp and the verification of the login
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['pending'], 0)
+        self.assertGreaterEqual(stats['max_queue_time'], 0)
+
+
+class HashPoolTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.size = motoapi.config['PASSWORD_HASH_POOL_SIZE']
+        motoapi.config['PASSWORD_HASH_POOL_SIZE'] = 2
+
+    def tearDown(self):
+        motoapi.config['PASSWORD_HASH_POOL_SIZE'] = self.size
+        super().tearDown()
+
+    def test_concurrency_limit(self):
+        pool = HashPool()
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            return threading.current_thread().name
+
+        callers = [threading.Thread(target=pool.run, args=(work,))
+                   for _ in range(6)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+        self.assertEqual(max(peak), 2)
+        stats = pool.stats()
+        self.assertEqual(stats['calls'], 6)
+        # Four of them waited for a free thread
+        self.assertGreater(stats['max_queue_time'], 0.04)
+        self.assertTrue(pool.run(work).startswith('password-hash'))
+
+    def test_inline(self):
+        motoapi.config['PASSWORD_HASH_POOL_SIZE'] = 0
+        pool = HashPool()
+        self.assertEqual(pool.run(threading.current_thread),
+            threading.current_thread())
+        self.assertIsNone(pool.executor)
+
+    def test_warns_when_gevent_is_not_patched(self):
+        uwsgi = types.SimpleNamespace(opt={'gevent': b'1000'})
+        with mock.patch.dict(sys.modules, uwsgi=uwsgi):
+            with self.assertLogs(motoapi.logger, 'WARNING') as logs:
+                check_cooperative()
+        self.assertIn('gevent-early-monkey-patch', logs.output[0])
@@ -0,0 +1,54 @@
+from motoapi import db
+from motoapi.models import LikedVariant
+
+from tests.base import DatabaseTestCase
+
+
+class QueryCountTestCase(DatabaseTestCase):
+    """Every endpoint must run the same number of queries however many
+    variants, and so brands, it serializes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.variations = self.add_catalog(20, 'QC', own_brands=True)
+        self.user, self.headers = self.add_user()
+
+    def count_queries(self, url, **kwargs):
+        # The test app context shares its session with the requests, start
+        # from an empty one like a real request does
+        db.session.expire_all()
+        with self.record_queries() as statements:
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return len(statements), len(response.json)
+
+    def test_variant_list(self):
+        self.assertEqual(
+            self.count_queries('/api/variant?page=0&page_size=2'), (1, 2))
+        self.assertEqual(
+            self.count_queries('/api/variant?page=0&page_size=15'), (1, 15))
+
+    def test_recommendation(self):
+        # Warm up the catalog cache, it is probed once per interval
+        self.client.get('/api/variant/recommendation?power=60')
+        few = self.count_queries(
+            '/api/variant/recommendation?power=60&page=0&page_size=2')
+        many = self.count_queries(
+            '/api/variant/recommendation?power=60&page=0&page_size=15')
+        self.assertEqual((few[0], few[1], many[1]), (many[0], 2, 15))
+
+    def test_swinger(self):
+        cold = self.count_queries('/api/variant/swinger',
+            headers=self.headers)
+        self.assertEqual(cold[1], 5)
+        self.client.post('/api/variant/swinger', headers=self.headers,
+            data={'variant': self.variations[0].id, 'liked': 1})
+        few = self.count_queries('/api/variant/swinger', headers=self.headers)
+        db.session.add_all([LikedVariant(variant=variation, user=self.user)
+            for variation in self.variations[1:10]])
+        db.session.commit()
+        many = self.count_queries('/api/variant/swinger',
+            headers=self.headers)
+        self.assertEqual(few, many)
+        self.assertEqual(many[1], 5)
@@ -0,0 +1,93 @@
+import re
+
+from motoapi import db
+from motoapi.models import User, TokenBlacklist
+
+from tests.base import DatabaseTestCase
+
+# "SCAN variation" is a full table scan, "SCAN variation USING INDEX ..."
+# walks an index and "SEARCH ..." looks rows up through one
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?!.* USING .*INDEX)')
+
+
+class QueryPlanTestCase(DatabaseTestCase):
+    """Runs the hot request paths, EXPLAINs every SELECT they issue and fails
+    if one of them scans a whole table.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.variations = self.add_catalog(10, 'QP')
+        self.user, self.headers = self.add_user()
+        self.user.password = User.generate_hash('password')
+        db.session.commit()
+
+    def full_scans(self, statements):
+        tables = set(db.metadata.tables)
+        scans = []
+        connection = db.engine.raw_connection()
+        cursor = connection.cursor()
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            for row in cursor.fetchall():
+                match = FULL_SCAN.match(row[-1])
+                if match and match.group(1) in tables:
+                    scans.append((row[-1], statement))
+        connection.close()
+        return scans
+
+    def assertNoFullScan(self, statements):
+        self.assertTrue(statements)
+        scans = self.full_scans(statements)
+        self.assertEqual(scans, [], '\n\n'.join(
+            '%s\n%s' % scan for scan in scans))
+
+    def test_auth(self):
+        with self.record_queries() as statements:
+            response = self.client.post('/api/auth/login',
+                data={'username': 'rider', 'password': 'password'})
+            self.assertEqual(response.status_code, 200)
+            headers = {
+                'Authorization': 'Bearer %s' % response.json['access_token']}
+            self.assertEqual(self.client.get('/api/user/me',
+                headers=headers).status_code, 200)
+            self.assertEqual(self.client.post('/api/auth/logout',
+                headers=headers).status_code, 200)
+            self.client.post('/api/auth/register', data={
+                'username': 'rider', 'email': 'other@motoapi.com',
+                'password': 'password', 'name': 'Rider'})
+        self.assertNoFullScan(statements)
+
+    def test_variants(self):
+        with self.record_queries() as statements:
+            self.client.get('/api/variant?page=0&page_size=5')
+            cursor = self.client.get(
+                '/api/variant?cursor=&page_size=5').json['next_cursor']
+            self.client.get('/api/variant?cursor=%s' % cursor)
+            self.client.get('/api/variant?displacement_min=600&power_max=80')
+            self.client.get('/api/variant?category=2&displacement_max=650')
+            self.client.get('/api/variant?brand=Honda&price_max=9000')
+            self.client.get('/api/variant?variant=%s' % self.variations[0].id)
+            self.client.get('/api/variant/recommendation?displacement=650')
+        self.assertNoFullScan(statements)
+
+    def test_swinger(self):
+        with self.record_queries() as statements:
+            self.client.get('/api/variant/swinger', headers=self.headers)
+            for variation, liked in zip(self.variations[:4], [1, 0, 1, 1]):
+                response = self.client.post('/api/variant/swinger',
+                    headers=self.headers, data={'variant': variation.id,
+                        'liked': liked, 'disliked': not liked})
+                self.assertEqual(response.status_code, 200)
+        self.assertNoFullScan(statements)
+
+    def test_token_purge(self):
+        with self.record_queries() as statements:
+            TokenBlacklist.purge_expired()
+        self.assertNoFullScan(statements)
+
+    def test_detects_full_scan(self):
+        self.assertTrue(self.full_scans([
+            ('SELECT * FROM variation WHERE name = ?', ('QP1',))]))
@@ -0,0 +1,84 @@
+from motoapi.catalog import recommendation_cache
+
+from tests.base import DatabaseTestCase
+
+
+class RecommendationTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(12):
+            self.add_variation('CB%s' % i, model_year=2000 + i,
+                displacement=500.0 + i, top_speed=180.0, power=50.0,
+                fuel_capacity=15.0, weight=190.0, valves_per_cylinder=4,
+                category=5)
+
+    def get(self, query):
+        response = self.client.get('/api/variant/recommendation?' + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json
+
+    def test_results_are_ranked(self):
+        response = self.get('model_year=2000')
+        self.assertEqual([v['model_year'] for v in response],
+            list(range(2011, 1999, -1)))
+        self.assertEqual(response[0]['matching'], 100.0)
+        self.assertEqual(response[-1]['matching'], 0.0)
+
+    def test_no_preference(self):
+        self.assertEqual(self.get(''), [])
+        self.assertEqual(self.get('unknown=1&page_size=5'), [])
+
+    def test_pagination(self):
+        ranking = [v['id'] for v in self.get('model_year=2003')]
+        pages = [
+            [v['id'] for v in self.get(
+                'model_year=2003&page=%s&page_size=5' % page)]
+            for page in range(3)]
+        self.assertEqual(pages, [ranking[:5], ranking[5:10], ranking[10:]])
+        self.assertEqual(self.get('model_year=2003&page=3&page_size=5'), [])
+
+    def test_kdtree_engine(self):
+        brute = self.get('model_year=2004&displacement=503&page_size=7')
+        recommendation_cache.clear()
+        self.motoapi.config['RECOMMENDATION_ENGINE'] = 'kdtree'
+        try:
+            kdtree = self.get('model_year=2004&displacement=503&page_size=7')
+        finally:
+            self.motoapi.config['RECOMMENDATION_ENGINE'] = 'brute'
+        self.assertEqual(kdtree, brute)
+
+    def test_batch(self):
+        queries = ['model_year=2004&displacement=503', 'displacement=511',
+                   'model_year=2000']
+        expected = [self.get(query + '&page_size=4') for query in queries]
+        response = self.client.post('/api/variant/recommendation/batch',
+            json={'limit': 4, 'preferences': [
+                {'model_year': 2004, 'displacement': 503, 'unknown': 'x'},
+                {'displacement': 511},
+                {'model_year': 2000}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, expected)
+
+    def test_batch_empty_preferences(self):
+        self.assertEqual(self.get('unknown=1'), [])
+        response = self.client.post('/api/variant/recommendation/batch',
+            json={'limit': 4, 'preferences': [
+                {}, {'unknown': 1}, {'displacement': 511}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json,
+            [[], [], self.get('displacement=511&page_size=4')])
+        response = self.client.post('/api/variant/recommendation/batch',
+            json={'preferences': [{}]})
+        self.assertEqual(response.json, [[]])
+
+    def test_batch_validation(self):
+        response = self.client.post('/api/variant/recommendation/batch',
+            json={'preferences': [{'power': 'fast'}]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/variant/recommendation/batch',
+            json={'preferences': [3]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/variant/recommendation/batch',
+            json={})
+        self.assertEqual(response.status_code, 400)
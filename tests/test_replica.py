@@ -0,0 +1,108 @@
+import os
+import tempfile
+
+from sqlalchemy import event
+
+from motoapi import motoapi, db
+from motoapi.models import Brand, Variation, User
+
+from tests.base import DatabaseTestCase
+
+REPLICA_DB = os.path.join(tempfile.gettempdir(), 'motoapi-test-replica.db')
+
+
+class ReplicaTestCase(DatabaseTestCase):
+    """Runs against two sqlite files, the replica is a stale copy of the
+    primary that never receives the writes.
+    """
+
+    def setUp(self):
+        motoapi.config['SQLALCHEMY_BINDS'] = {
+            'replica': 'sqlite:///' + REPLICA_DB}
+        super().setUp()
+        self.replica = db.get_engine(motoapi, bind='replica')
+        db.Model.metadata.drop_all(bind=self.replica)
+        db.Model.metadata.create_all(bind=self.replica)
+        self.variation_ids = [
+            variation.id for variation in self.add_catalog(8, 'RP')]
+        self.user, self.headers = self.add_user()
+        self.other, self.other_headers = self.add_user('other')
+        self.user.password = User.generate_hash('password')
+        db.session.commit()
+        self.copy_to_replica(Brand, Variation, User)
+        self.add_variation('primary only')
+
+        self.replica_queries = []
+        event.listen(self.replica, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(self.replica, 'before_cursor_execute', self.record)
+        db.Model.metadata.drop_all(bind=self.replica)
+        db.recent_writers.clear()
+        super().tearDown()
+        motoapi.config['SQLALCHEMY_BINDS'] = {}
+
+    def record(self, conn, cursor, statement, parameters, context, many):
+        self.replica_queries.append(statement)
+
+    def copy_to_replica(self, *models):
+        with self.replica.begin() as connection:
+            for model in models:
+                rows = db.session.execute(model.__table__.select()).fetchall()
+                connection.execute(model.__table__.insert(),
+                    [dict(row) for row in rows])
+
+    def request(self, method, url, **kwargs):
+        # Every request gets its own session, like outside of the tests
+        db.session.remove()
+        self.replica_queries = []
+        response = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(response.status_code, 200, response.json)
+        return response.json
+
+    def test_reads_go_to_the_replica(self):
+        names = {v['name'] for v in self.request('get', '/api/variant')}
+        self.assertNotIn('primary only', names)
+        self.assertTrue(self.replica_queries)
+        self.request('get', '/api/variant/swinger', headers=self.headers)
+        self.assertTrue(self.replica_queries)
+
+    def test_writes_go_to_the_primary(self):
+        self.request('post', '/api/auth/login',
+            data={'username': 'rider', 'password': 'password'})
+        self.assertEqual(self.replica_queries, [])
+        self.request('post', '/api/variant/swinger', headers=self.headers,
+            data={'variant': self.variation_ids[0], 'liked': 1})
+        self.assertEqual(self.replica_queries, [])
+
+    def test_read_your_writes(self):
+        liked = self.variation_ids[0]
+        self.request('post', '/api/variant/swinger', headers=self.headers,
+            data={'variant': liked, 'liked': 1})
+        # The replica has no swipes, the swinger must still skip the like
+        recommended = self.request('get', '/api/variant/swinger',
+            headers=self.headers)
+        self.assertEqual(self.replica_queries, [])
+        self.assertNotIn(liked, [v['id'] for v in recommended])
+        self.request('get', '/api/variant/swinger',
+            headers=self.other_headers)
+        self.assertTrue(self.replica_queries)
+
+    def test_tokens_are_read_from_the_primary(self):
+        # Tokens are never copied, yet authenticated reads work
+        self.request('get', '/api/user/me', headers=self.headers)
+        self.assertTrue(all('token_blacklist' not in statement
+                            for statement in self.replica_queries))
+
+    def test_login_reads_from_the_primary(self):
+        # Registered after the replica copy, the replica doesn't know them
+        user, _ = self.add_user('newcomer')
+        user.password = User.generate_hash('password')
+        db.session.commit()
+        access_token = self.request('post', '/api/auth/login',
+            data={'username': 'newcomer', 'password': 'password'}
+            )['access_token']
+        me = self.request('get', '/api/user/me',
+            headers={'Authorization': 'Bearer %s' % access_token})
+        self.assertEqual(me['username'], 'newcomer')
+        self.assertEqual(self.replica_queries, [])
@@ -0,0 +1,132 @@
+import datetime
+import time
+import uuid
+
+from flask_jwt_extended import create_access_token
+
+from motoapi import motoapi, db
+from motoapi.models import TokenBlacklist, CacheGeneration
+from motoapi.revocation import revocation_cache, token_purger
+from motoapi.utils import add_token_to_database, unrevoke_token
+
+from tests.base import DatabaseTestCase
+
+
+class RevocationCacheTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.interval = motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL']
+        motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL'] = 60
+        self.user, self.headers = self.add_user()
+
+    def tearDown(self):
+        motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL'] = self.interval
+        super().tearDown()
+
+    def me(self, headers=None):
+        return self.client.get('/api/user/me',
+            headers=headers or self.headers).status_code
+
+    def blacklist_lookups(self, statements):
+        return [statement for statement, _ in statements
+                if 'FROM token_blacklist' in statement]
+
+    def test_known_good_tokens_skip_the_database(self):
+        self.user, self.headers = self.add_admin()
+        self.assertEqual(self.me(), 200)
+        with self.record_queries() as statements:
+            for _ in range(3):
+                self.assertEqual(self.me(), 200)
+        self.assertEqual(self.blacklist_lookups(statements), [])
+        # The stats request is checked with the same token
+        stats = self.client.get('/api/stats/tokens',
+            headers=self.headers).json
+        self.assertEqual(stats['lookups'], 5)
+        self.assertEqual(stats['database_lookups'], 1)
+        self.assertEqual(stats['hit_rate'], 0.8)
+        self.assertEqual(stats['avoided_lookups'], 3)
+
+    def test_logout_revokes_immediately(self):
+        self.assertEqual(self.me(), 200)
+        self.assertEqual(self.client.post('/api/auth/logout',
+            headers=self.headers).status_code, 200)
+        self.assertEqual(self.me(), 401)
+        # Revoked tokens are answered from the cache too
+        with self.record_queries() as statements:
+            self.assertEqual(self.me(), 401)
+        self.assertEqual(self.blacklist_lookups(statements), [])
+
+    def test_unrevoke(self):
+        token = TokenBlacklist.query.filter_by(
+            user_identity=str(self.user.id)).one()
+        self.client.post('/api/auth/logout', headers=self.headers)
+        self.assertEqual(self.me(), 401)
+        unrevoke_token(token.id, str(self.user.id))
+        self.assertEqual(self.me(), 200)
+
+    def test_other_workers_follow_the_generation(self):
+        self.assertEqual(self.me(), 200)
+        # Another worker revokes the token, this one only sees the bump
+        TokenBlacklist.query.filter_by(
+            user_identity=str(self.user.id)).update({'revoked': True})
+        CacheGeneration.bump('revocation')
+        db.session.commit()
+        self.assertEqual(self.me(), 200)
+        motoapi.config['REVOKED_TOKEN_CACHE_INTERVAL'] = 0
+        self.assertEqual(self.me(), 401)
+
+    def test_ttl_is_capped_at_the_expiration(self):
+        token = create_access_token(identity=self.user.id,
+            expires_delta=datetime.timedelta(seconds=5))
+        add_token_to_database(token, motoapi.config['JWT_IDENTITY_CLAIM'])
+        self.assertEqual(self.me({'Authorization': 'Bearer %s' % token}), 200)
+        jti = TokenBlacklist.query.order_by(TokenBlacklist.id.desc()).first(
+            ).jti
+        expires_at = revocation_cache.known_good.entries[jti][1]
+        self.assertLessEqual(expires_at - time.monotonic(), 5)
+
+
+
+class TokenPurgeTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.headers = self.add_user()
+        now = datetime.datetime.now()
+        for days in [-3, -2, -1, -1, -1, 1]:
+            db.session.add(TokenBlacklist(jti=str(uuid.uuid4()),
+                token_type='access', user_identity=str(self.user.id),
+                revoked=days == -1, expires=now + datetime.timedelta(days)))
+        db.session.commit()
+
+    def test_purge_expired_in_batches(self):
+        before = TokenBlacklist.table_stats()
+        self.assertEqual((before['rows'], before['expired']), (7, 5))
+        with self.record_queries() as statements:
+            self.assertEqual(TokenBlacklist.purge_expired(batch_size=2), 5)
+        self.assertEqual(len([statement for statement, _ in statements
+                              if statement.startswith('DELETE')]), 3)
+        after = TokenBlacklist.table_stats()
+        self.assertEqual((after['rows'], after['expired']), (2, 0))
+        # A page per table and index, too few rows to free one
+        self.assertEqual(after['size'], before['size'])
+        self.assertEqual(self.client.get('/api/user/me',
+            headers=self.headers).status_code, 200)
+
+    def test_background_purge(self):
+        token_purger.purge()
+        self.assertEqual(TokenBlacklist.query.count(), 2)
+        _, headers = self.add_admin()
+        stats = self.client.get('/api/stats/tokens',
+            headers=headers).json['purge']
+        self.assertEqual(stats['deleted'], 5)
+
+    def test_jti_is_stored_in_16_bytes(self):
+        jti = TokenBlacklist.query.filter_by(token_type='access').first().jti
+        self.assertEqual(str(uuid.UUID(jti)), jti)
+        stored = db.session.execute(
+            'select jti from token_blacklist limit 1').scalar()
+        self.assertEqual(len(stored), 16)
+        self.assertEqual(
+            TokenBlacklist.query.filter_by(jti=jti).one().jti, jti)
@@ -0,0 +1,190 @@
+import random
+import unittest
+
+import numpy as np
+
+from motoapi.models import Variation, parse_feature
+from motoapi.scoring import FeatureMatrix
+
+
+def reference_rank(bikes, preference):
+    min_attributes = {}
+    max_attributes = {}
+    for bike in bikes.values():
+        for attr in preference:
+            min_attributes[attr] = min(
+                min_attributes.get(attr, bike[attr]), bike[attr])
+            max_attributes[attr] = max(
+                max_attributes.get(attr, bike[attr]), bike[attr])
+    distances = []
+    for bike_id, bike in bikes.items():
+        distance = 0
+        for attr in preference:
+            mn, mx = min_attributes[attr], max_attributes[attr]
+            div = (mx - mn) or 1
+            distance += abs((bike[attr] - mn) / div -
+                (preference[attr] - mn) / div)
+        distances.append((bike_id, distance))
+    min_distance = min(d for _, d in distances)
+    div = (max(d for _, d in distances) - min_distance) or 1
+    distances = [(bike_id, ((d - min_distance) / div) * 100)
+                 for bike_id, d in distances]
+    distances.sort(key=lambda x: x[1], reverse=True)
+    return distances
+
+
+class FeatureMatrixTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(42)
+        self.bikes = {
+            bike_id: {
+                'displacement': float(rnd.randint(50, 1500)),
+                'power': rnd.uniform(2, 200),
+                'category': float(rnd.randint(0, 7)),
+                # Constant columns are shifted but not scaled
+                'valves_per_cylinder': 4.0,
+            } for bike_id in range(1, 501)}
+        self.preference = {
+            'power': 98.0,
+            'displacement': 1198.0,
+            'valves_per_cylinder': 2.0,
+            'category': 5.0,
+        }
+
+    def test_rank_matches_reference(self):
+        matrix = FeatureMatrix.from_bikes(self.bikes, self.preference)
+        self.assertEqual(
+            matrix.rank(self.preference),
+            reference_rank(self.bikes, self.preference))
+
+    def test_rank_keeps_ties_in_catalog_order(self):
+        bikes = {3: {'power': 10.0}, 1: {'power': 30.0}, 2: {'power': 10.0}}
+        matrix = FeatureMatrix.from_bikes(bikes, ['power'])
+        self.assertEqual(matrix.rank({'power': 30.0}),
+            [(3, 100.0), (2, 100.0), (1, 0.0)])
+
+    def test_top_matches_full_sort(self):
+        rnd = random.Random(7)
+        # Few distinct values so many ties straddle the selection boundary
+        scores = np.array([float(rnd.randint(0, 5)) for _ in range(300)])
+        order = np.argsort(-scores, kind='stable').tolist()
+        for k in (0, 1, 5, 49, 50, 51, 299, 300, 400):
+            self.assertEqual(FeatureMatrix.top(scores, k).tolist(), order[:k])
+
+    def test_rank_pages(self):
+        matrix = FeatureMatrix.from_bikes(self.bikes, self.preference)
+        ranked = matrix.rank(self.preference)
+        self.assertEqual(matrix.rank(self.preference, limit=10), ranked[:10])
+        self.assertEqual(matrix.rank(self.preference, limit=10, offset=490),
+            ranked[490:])
+
+    def test_empty_catalog(self):
+        matrix = FeatureMatrix.from_bikes({}, ['power'])
+        self.assertEqual(matrix.rank({'power': 30.0}), [])
+
+    def test_parsed_features(self):
+        specs = {
+            'displacement': lambda bike: '%d ccm' % bike['displacement'],
+            'power': lambda bike: '%.1f HP (%.1f  kW))' % (
+                bike['power'] * 1.34, bike['power']),
+            'category': lambda bike: Variation.CATEGORIES[
+                int(bike['category'])],
+            'valves_per_cylinder': lambda bike: '4',
+        }
+        bikes = {
+            bike_id: {attr: parse_feature(attr, spec(bike))
+                      for attr, spec in specs.items()}
+            for bike_id, bike in self.bikes.items()}
+        matrix = FeatureMatrix.from_bikes(bikes, self.preference)
+        self.assertEqual(matrix.rank(self.preference),
+            reference_rank(bikes, self.preference))
+        for column, attr in enumerate(matrix.attributes):
+            values = [bike[attr] for bike in bikes.values()]
+            self.assertEqual(matrix.min[column], min(values))
+            self.assertEqual(matrix.max[column], max(values))
+
+
+class KDTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(3)
+        # Integer features produce plenty of equal distances
+        self.bikes = {
+            bike_id: {
+                'model_year': float(rnd.randint(1990, 2022)),
+                'displacement': float(rnd.randint(50, 1500)),
+                'power': float(rnd.randint(5, 200)),
+                'category': float(rnd.randint(0, 7)),
+                'valves_per_cylinder': float(rnd.randint(1, 4)),
+            } for bike_id in range(1, 3001)}
+        self.matrix = FeatureMatrix.from_bikes(
+            self.bikes, ['model_year', 'displacement', 'power', 'category',
+                         'valves_per_cylinder'])
+
+    def test_matches_brute_force(self):
+        preferences = [
+            {'power': 98.0, 'displacement': 1198.0, 'category': 5.0},
+            {'category': 6.0},
+            {'model_year': 2030.0, 'power': -10.0},
+            {'valves_per_cylinder': 4.0, 'model_year': 2005.0,
+             'displacement': 600.0, 'power': 60.0, 'category': 1.0},
+        ]
+        for preference in preferences:
+            for limit, offset in ((0, 0), (1, 0), (5, 0), (50, 20),
+                                  (10, 2990)):
+                self.assertEqual(
+                    self.matrix.rank(preference, limit, offset,
+                        use_index=True),
+                    self.matrix.rank(preference, limit, offset))
+
+    def test_matching_ties_at_the_limit(self):
+        # 306 and 950 are 322 away from 628 up to an ulp, they get the same
+        # matching and the lowest row must win like in brute force
+        matrix = FeatureMatrix([1, 2, 3, 4, 5], ['power'],
+            [[306.0], [701.0], [625.0], [97.0], [950.0]])
+        self.assertEqual(matrix.rank({'power': 628.0}, limit=2,
+            use_index=True), matrix.rank({'power': 628.0}, limit=2))
+        self.assertEqual([bike_id for bike_id, _ in matrix.rank(
+            {'power': 628.0}, limit=2, use_index=True)], [4, 1])
+
+    def test_exclude(self):
+        preference = {'power': 98.0, 'displacement': 1198.0, 'category': 5.0}
+        ranked = self.matrix.rank(preference)
+        exclude = np.array(sorted(
+            bike_id for bike_id, _ in ranked[:40:3]) + [99999])
+        expected = [r for r in ranked if r[0] not in set(exclude.tolist())]
+        for use_index in (False, True):
+            self.assertEqual(
+                self.matrix.rank(preference, 10, 5, use_index=use_index,
+                    exclude=exclude),
+                expected[5:15])
+        self.assertEqual(self.matrix.rank(preference, exclude=exclude),
+            expected)
+
+    def test_rank_many(self):
+        preferences = [
+            {'power': 98.0, 'displacement': 1198.0, 'category': 5.0},
+            {'category': 5.0, 'power': 98.0, 'displacement': 1198.0},
+            {},
+            {'model_year': 2030.0},
+        ]
+        expected = [self.matrix.rank(p, 20) for p in preferences]
+        self.assertEqual(self.matrix.rank_many(preferences, 20), expected)
+        # One preference per chunk
+        self.assertEqual(
+            self.matrix.rank_many(preferences, 20, chunk_size=1), expected)
+
+    def test_nearest(self):
+        columns, values = self.matrix.normalize({'power': 98.0})
+        rows, distance = self.matrix.get_index().query(columns, values, 10)
+        brute = self.matrix.distances({'power': 98.0})
+        order = np.lexsort((np.arange(len(brute)), brute))[:10]
+        self.assertEqual(rows.tolist(), order.tolist())
+        self.assertEqual(distance.tolist(), brute[order].tolist())
+
+    def test_constant_catalog(self):
+        matrix = FeatureMatrix.from_bikes(
+            {i: {'power': 10.0} for i in range(100)}, ['power'])
+        self.assertEqual(matrix.rank({'power': 3.0}, 5, use_index=True),
+            matrix.rank({'power': 3.0}, 5))
@@ -0,0 +1,117 @@
+from unittest import mock
+
+from motoapi import db
+from motoapi.models import (LikedVariant, DislikedVariant, UserPreference,
+    Variation, VariantStats)
+from motoapi.resources.variant import get_recommendations
+
+from tests.base import DatabaseTestCase
+
+
+class SwingerTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.variations = self.add_catalog(20, 'SV')
+        self.user, self.headers = self.add_user()
+
+    def swipe(self, variation, liked=True):
+        response = self.client.post('/api/variant/swinger', headers=self.headers,
+            data={'variant': variation.id, 'liked': liked,
+                  'disliked': not liked})
+        self.assertEqual(response.status_code, 200)
+        return response.json
+
+    def average(self, variations):
+        return {
+            f: sum(getattr(v, f) for v in variations) / len(variations)
+            for f in Variation.FEATURES}
+
+    def test_likes_update_preference(self):
+        liked = self.variations[2:5]
+        for variation in liked:
+            self.swipe(variation)
+        self.swipe(self.variations[3])
+        self.swipe(self.variations[9], liked=False)
+        preference = UserPreference.query.get(self.user.id)
+        self.assertEqual(preference.count, 3)
+        average = self.average(liked)
+        for feature, value in preference.get_average().items():
+            self.assertAlmostEqual(value, average[feature])
+
+    def test_rebuild(self):
+        for variation in self.variations[:3]:
+            db.session.add(LikedVariant(variant=variation, user=self.user))
+        db.session.commit()
+        # Likes recorded before the preference existed are picked up
+        self.swipe(self.variations[7])
+        preference = UserPreference.query.get(self.user.id)
+        self.assertEqual(preference.count, 4)
+
+        preference.count = 0
+        db.session.commit()
+        UserPreference.rebuild(None)
+        db.session.commit()
+        preference = UserPreference.query.get(self.user.id)
+        self.assertEqual(preference.count, 4)
+        average = self.average(self.variations[:3] + self.variations[7:8])
+        for feature, value in preference.get_average().items():
+            self.assertAlmostEqual(value, average[feature])
+
+    def test_recommends_unseen(self):
+        response = self.swipe(self.variations[0])
+        self.assertEqual(len(response), 5)
+        self.assertNotIn(self.variations[0].id, [v['id'] for v in response])
+        response = self.client.get('/api/variant/swinger',
+            headers=self.headers).json
+        self.assertEqual(len(response), 5)
+
+    def test_seen_are_excluded_before_ranking(self):
+        for variation in self.variations[:6]:
+            self.swipe(variation)
+        for variation in self.variations[6:12]:
+            self.swipe(variation, liked=False)
+        seen = set(v.id for v in self.variations[:12])
+        preference = UserPreference.query.get(self.user.id).get_average()
+        ranked = [r[0] for r in get_recommendations(preference, limit=None)]
+        for engine in ('brute', 'kdtree'):
+            self.motoapi.config['RECOMMENDATION_ENGINE'] = engine
+            try:
+                response = self.client.get('/api/variant/swinger',
+                    headers=self.headers).json
+            finally:
+                self.motoapi.config['RECOMMENDATION_ENGINE'] = 'brute'
+            self.assertEqual([v['id'] for v in response],
+                [i for i in ranked if i not in seen][:5])
+
+    def test_cold_start_walks_the_pool(self):
+        picked = []
+        for _ in range(4):
+            response = self.client.get('/api/variant/swinger',
+                headers=self.headers).json
+            self.assertEqual(len(response), 5)
+            picked += [v['id'] for v in response]
+        self.assertEqual(sorted(picked), sorted(v.id for v in self.variations))
+
+    def test_cold_start_skips_disliked(self):
+        for variation in self.variations[:17]:
+            self.swipe(variation, liked=False)
+        response = self.client.get('/api/variant/swinger',
+            headers=self.headers).json
+        self.assertEqual(sorted(v['id'] for v in response),
+            sorted(v.id for v in self.variations[17:]))
+
+    def test_concurrent_swipes(self):
+        self.swipe(self.variations[0])
+        self.swipe(self.variations[1], liked=False)
+        # A concurrent request swiped them after the check of this one
+        with mock.patch('motoapi.resources.variant.swiped',
+                        return_value=False):
+            self.swipe(self.variations[0])
+            self.swipe(self.variations[1], liked=False)
+        self.assertEqual(LikedVariant.query.count(), 1)
+        self.assertEqual(DislikedVariant.query.count(), 1)
+        self.assertEqual(UserPreference.query.get(self.user.id).count, 1)
+        self.assertEqual(
+            [(s.likes, s.dislikes) for s in VariantStats.query.order_by(
+                VariantStats.variant_id)], [(1, 0), (0, 1)])
@@ -0,0 +1,54 @@
+from motoapi.models import Brand, Variation
+
+from tests.base import DatabaseTestCase
+
+
+class VariantFilterTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        yamaha = Brand(name='Yamaha')
+        self.variations = [
+            self.add_variation('VF%s' % i,
+                brand=yamaha if i % 2 else None, displacement=125.0 * i,
+                power=10.0 * i, price=1000.0 * i, category=i % 3)
+            for i in range(1, 9)]
+        self.add_variation('VFerror', fetch_state='error',
+            displacement=500.0)
+
+    def ids(self, **filters):
+        response = self.client.get('/api/variant', query_string=filters)
+        self.assertEqual(response.status_code, 200, response.json)
+        return sorted(item['id'] for item in response.json)
+
+    def expected(self, condition):
+        return sorted(v.id for v in self.variations if condition(v))
+
+    def test_ranges(self):
+        self.assertEqual(self.ids(displacement_min=500),
+            self.expected(lambda v: v.displacement >= 500))
+        self.assertEqual(self.ids(displacement_min=250, power_max=60),
+            self.expected(lambda v: 250 <= v.displacement and v.power <= 60))
+        self.assertEqual(self.ids(price_max=3500.5),
+            self.expected(lambda v: v.price <= 3500.5))
+
+    def test_category_and_brand(self):
+        self.assertEqual(self.ids(category=1),
+            self.expected(lambda v: v.category == 1))
+        self.assertEqual(self.ids(category=Variation.CATEGORIES[2]),
+            self.expected(lambda v: v.category == 2))
+        self.assertEqual(self.ids(brand='Yamaha', displacement_max=600),
+            self.expected(lambda v: v.brand.name == 'Yamaha'
+                          and v.displacement <= 600))
+        self.assertEqual(self.ids(brand='Ducati'), [])
+
+    def test_with_cursor(self):
+        response = self.client.get('/api/variant', query_string={
+            'cursor': '', 'page_size': 2, 'power_max': 50})
+        self.assertEqual([item['id'] for item in response.json['items']],
+            self.expected(lambda v: v.power <= 50)[:2])
+
+    def test_invalid(self):
+        for filters in [{'category': 'Scooter'}, {'power_min': 'fast'}]:
+            response = self.client.get('/api/variant', query_string=filters)
+            self.assertEqual(response.status_code, 400)